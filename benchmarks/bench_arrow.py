@@ -0,0 +1,34 @@
+"""Time reading a piece from CSV and from a memory-mapped Arrow piece.
+
+Both must return the same data. Typing a piece costs one CSV read plus a
+write, which pays off once a piece is read more than once.
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+from common import best_of
+from synthetic import generate
+from mlbt.read_raw import read_raw, write_arrow
+
+
+def main(sizes=(100_000, 1_000_000)):
+    with tempfile.TemporaryDirectory() as tempdir:
+        for n in sizes:
+            path = generate(os.path.join(tempdir, f'raw_{n}.csv'), n)
+            old, old_time = best_of(lambda: read_raw(path))
+            piece = os.path.join(tempdir, f'raw_{n}.arrow')
+            _, write_time = best_of(lambda: write_arrow(old, piece), 1)
+            new, new_time = best_of(lambda: read_raw(piece))
+            pd.testing.assert_frame_equal(old, new)
+            print(f'{n:>12,} rows  csv: {old_time:6.2f}s  '
+                  f'arrow: {new_time:6.2f}s (write {write_time:5.2f}s)  '
+                  f'speedup: {old_time / new_time:5.1f}x  '
+                  f'size: {os.path.getsize(path) / 2**20:,.0f} MB csv, '
+                  f'{os.path.getsize(piece) / 2**20:,.0f} MB arrow')
+
+
+if __name__ == '__main__':
+    main()
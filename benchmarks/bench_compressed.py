@@ -0,0 +1,89 @@
+"""Time splitting plain and compressed raw files.
+
+Compressed files are written as a single gzip member, as BGZF (blocks of
+independent gzip members) and as seekable zstd. Pieces must be the same
+for all of them. Block-compressed files are decompressed in parallel, a
+single gzip member serially.
+"""
+
+import filecmp
+import gzip
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+import zstandard
+
+from common import best_of
+from synthetic import generate
+from mlbt import make_data
+
+
+def write_bgzf(source, path, block_size=65_280):
+    """Write file compressed as BGZF blocks, as `bgzip` does."""
+    def block(data):
+        c = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = c.compress(data) + c.flush()
+        size = 18 + len(deflated) + 8
+        header = (b'\x1f\x8b\x08\x04' + bytes(4) + b'\x00\xff'
+                  + struct.pack('<H2sHH', 6, b'BC', 2, size - 1))
+        return header + deflated + struct.pack(
+            '<II', zlib.crc32(data), len(data))
+    with open(source, 'rb') as src, open(path, 'wb') as dst:
+        for data in iter(lambda: src.read(block_size), b''):
+            dst.write(block(data))
+        dst.write(block(b''))
+    return path
+
+
+def write_seekable_zstd(source, path, frame_size=2**20):
+    """Write file as zstd frames followed by a seek table."""
+    c = zstandard.ZstdCompressor(level=3)
+    entries = []
+    with open(source, 'rb') as src, open(path, 'wb') as dst:
+        for data in iter(lambda: src.read(frame_size), b''):
+            frame = c.compress(data)
+            dst.write(frame)
+            entries.append(struct.pack('<II', len(frame), len(data)))
+        table = b''.join(entries) + struct.pack(
+            '<IBI', len(entries), 0, 0x8F92EAB1)
+        dst.write(struct.pack('<II', 0x184D2A5E, len(table)) + table)
+    return path
+
+
+def write_gzip(source, path):
+    with open(source, 'rb') as src, gzip.open(path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return path
+
+
+def main(sizes=(1_000_000,), n_pieces=4):
+    with tempfile.TemporaryDirectory() as tempdir:
+        for n in sizes:
+            plain = generate(os.path.join(tempdir, f'raw_{n}.csv'), n)
+            files = {
+                'plain': plain,
+                'gzip': write_gzip(plain, plain + '.gz'),
+                'bgzf': write_bgzf(plain, plain + '.bgzf.gz'),
+                'zstd': write_seekable_zstd(plain, plain + '.zst'),
+            }
+            print(f'{n:,} rows')
+            expected = None
+            for name, path in files.items():
+                out = os.path.join(tempdir, name)
+                os.makedirs(out)
+                pieces, secs = best_of(
+                    lambda: make_data.split_file.__wrapped__(path, out,
+                                                             n_pieces))
+                if expected is None:
+                    expected = pieces
+                assert all(filecmp.cmp(a, b, shallow=False)
+                           for a, b in zip(expected, pieces))
+                mb = os.path.getsize(path) / 2**20
+                print(f'  {name:>6}: {mb:6.1f} MB  split: {secs:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""Time reading raw data with pandas' and pyarrow's CSV parsers.
+
+Both engines must return the same data.
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+from common import best_of
+from synthetic import generate
+from mlbt.read_raw import read_raw
+
+
+def main(sizes=(100_000, 1_000_000, 3_000_000)):
+    with tempfile.TemporaryDirectory() as tempdir:
+        for n in sizes:
+            path = generate(os.path.join(tempdir, f'raw_{n}.csv'), n)
+            old, old_time = best_of(lambda: read_raw(path))
+            new, new_time = best_of(lambda: read_raw(path, engine='pyarrow'))
+            pd.testing.assert_frame_equal(old, new)
+            print(f'{len(new):>12,} rows  c: {old_time:6.2f}s  '
+                  f'pyarrow: {new_time:6.2f}s  '
+                  f'speedup: {old_time / new_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
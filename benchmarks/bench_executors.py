@@ -0,0 +1,66 @@
+"""Time ingesting a raw file on each executor backend.
+
+Ingests a synthetic raw file (see `make_data.ingest_data`) with workers of
+each backend. Dask runs on a local cluster that is passed to the pipeline
+by address, so that it takes the multi-node code path, and Ray on a local
+cluster started by the pipeline, whose start is timed. On both, parts of
+pieces go to a directory given as shared with the workers, and workers
+group and clean their own pieces. That all backends give the same cleaned
+data and sample counts as running in process is tested in
+`tests/test_make_data.py`. Backends whose package is not installed are
+skipped. Cleaned pieces are merged in this process on all backends, so
+times include merging.
+
+Usage: python benchmarks/bench_executors.py [N_ROWS] [N_WORKERS]
+"""
+
+import contextlib
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import generate
+# importing cleaners and selectors registers them
+from mlbt import cleaners, make_data, selectors
+
+
+def available(backend):
+    module = {'dask': 'dask.distributed', 'ray': 'ray'}.get(backend)
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def ingest(path, backend, n_workers, n_pieces, parts_root):
+    """Return cleaned data, counts, and seconds of ingest on backend."""
+    with contextlib.ExitStack() as stack:
+        address = None
+        if backend == 'dask':
+            from dask import distributed
+            cluster = stack.enter_context(distributed.LocalCluster(
+                n_workers=n_workers, threads_per_worker=1,
+                dashboard_address=None))
+            address = cluster.scheduler_address
+        if backend in ('local', 'process'):
+            parts_root = None
+        start = time.perf_counter()
+        df, counts = make_data.ingest_data.__wrapped__(
+            path, n_pieces, n_workers, backend=backend, address=address,
+            parts_root=parts_root)
+        return df, counts, time.perf_counter() - start
+
+
+def main(n_rows=200_000, n_workers=2, n_pieces=8):
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = generate(os.path.join(tempdir, 'raw.csv'), n_rows)
+        print(f'{n_rows:,} rows, {n_pieces} pieces, {n_workers} workers')
+        for backend in ['local', 'process', 'dask', 'ray']:
+            if not available(backend):
+                print(f'  {backend:>7}: not installed')
+                continue
+            *_, secs = ingest(path, backend, n_workers, n_pieces, tempdir)
+            print(f'  {backend:>7}: {secs:6.2f}s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,81 @@
+"""Time selector chain run one by one and fused on a table of users.
+
+Both must return the same txns and sample counts, up to float rounding of
+summed values. Fusing pays off when most users pass each selector; if an
+early selector drops most users, later ones run one by one see little data.
+"""
+
+import numpy as np
+import pandas as pd
+
+from common import best_of
+from mlbt import deferred, selectors  # importing selectors registers them
+from mlbt.decorators import count, selector_funcs
+
+
+def make_data(n_users, txns_per_month=25, seed=0):
+    """Return txns with all columns used by the selectors.
+
+    Most users pass each selector, as in the raw extracts.
+    """
+    rng = np.random.default_rng(seed)
+    n_months = rng.integers(3, 37, n_users)
+    user = np.repeat(np.arange(n_users, dtype='int32'),
+                     n_months * txns_per_month)
+    n = len(user)
+    start = rng.integers(0, 365 * 5, n_users)[user]
+    days = start + (rng.random(n) * n_months[user] * 30.4).astype(int)
+    is_income = rng.random(n) < 1.5 / txns_per_month
+    pay = rng.lognormal(7.5, .5, n_users)[user]
+    df = pd.DataFrame({
+        'user_id': user,
+        'transaction_date': (pd.Timestamp('2012-01-01')
+                             + pd.to_timedelta(days, unit='D')),
+        'amount': np.where(is_income, -pay, rng.lognormal(3, 1, n) + 15),
+        'tag': np.where(is_income, 'earnings_income', 'groceries'),
+    })
+    df['amount'] = df.amount.astype('float32')
+    df = df.sort_values(['user_id', 'transaction_date'], ignore_index=True)
+    df['ym'] = (df.transaction_date.dt.year * 100
+                + df.transaction_date.dt.month)
+    n_accounts = rng.integers(1, 13, n_users)[user]
+    df['account_id'] = (user * 20 + rng.integers(0, n_accounts)).astype('int32')
+    df['account_type'] = rng.choice(['current', 'savings'], n, p=[.9, .1])
+    df['year_of_birth'] = (rng.integers(1940, 2010, n_users)[user]
+                           .astype('float32'))
+    # wide frame, as after cleaning
+    for i in range(20):
+        df[f'col_{i}'] = rng.random(n)
+    return df
+
+
+def sequential(df):
+    count.clear()
+    for func in selector_funcs:
+        df = func(df)
+    return df
+
+
+def fused(df):
+    count.clear()
+    return deferred.run(df, selector_funcs, fused=True, lazy=False)
+
+
+def main(sizes=(2_000, 10_000)):
+    for n in sizes:
+        df = make_data(n)
+        print(f'{n:,} users, {len(df):,} txns')
+        (old, old_count), old_time = best_of(lambda: sequential(df))
+        old_count = old_count.copy()
+        (new, new_count), new_time = best_of(lambda: fused(df))
+        pd.testing.assert_frame_equal(old, new)
+        assert list(old_count) == list(new_count)
+        assert np.allclose(list(old_count.values()),
+                           list(new_count.values()), rtol=1e-5)
+        print(f'  one by one: {old_time:6.2f}s  fused: {new_time:6.2f}s  '
+              f'speedup: {old_time / new_time:5.1f}x  '
+              f'users kept: {new.user_id.nunique():,}')
+
+
+if __name__ == '__main__':
+    main()
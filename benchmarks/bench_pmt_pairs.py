@@ -0,0 +1,114 @@
+"""Time transfer-pair matcher against the previous k-nearest-neighbour loop.
+
+Also times the vectorised `match_pairs` against the greedy loop it
+replaced. The previous implementations are kept here as references for
+the equivalence tests in `tests/test_cleaners.py`.
+"""
+
+import collections
+import time
+
+import numpy as np
+import pandas as pd
+
+from common import best_of
+from mlbt.cleaners import match_pairs, tag_pmt_pairs
+
+
+def tag_pmt_pairs_knn(df, knn=5):
+    """Previous implementation of `cleaners.tag_pmt_pairs`."""
+    df['amount'] = df.amount.abs()
+    df = df.sort_values(['user_id', 'amount', 'transaction_date'])
+    for k in range(1, knn+1):
+        meets_conds = (
+            (df.user_id.values == df.user_id.shift(k).values)
+            & (df.amount.values > 50)
+            & (df.amount.values == df.amount.shift(k).values)
+            & (df.transaction_date.diff(k).dt.days.values <= 4)
+            & (df.credit_debit.values != df.credit_debit.shift(k).values)
+            & (df.tag.values != 'transfers')
+            & (df.tag.shift(k).values != 'transfers')
+        )
+        neighbr_meets_cond = np.roll(meets_conds, k)
+        neighbr_meets_cond[:k] = False
+        is_tfr = meets_conds & ~neighbr_meets_cond
+        df['tag'] = np.where(is_tfr, 'transfers', df.tag)
+        mask = np.roll(meets_conds, -k)
+        mask[-k:] = False
+        df['tag'] = np.where(mask, 'transfers', df.tag)
+    return df
+
+
+def match_pairs_loop(group, time, credit, window):
+    """Previous implementation of `cleaners.match_pairs`."""
+    paired = np.zeros(len(group), dtype=bool)
+    unpaired = {True: collections.deque(), False: collections.deque()}
+    current = None
+    for i, (g, t, c) in enumerate(zip(group.tolist(), time.tolist(),
+                                      credit.tolist())):
+        if g != current:
+            current = g
+            unpaired[True].clear()
+            unpaired[False].clear()
+        other = unpaired[not c]
+        while other and t - other[0][0] >= window:
+            other.popleft()
+        if other:
+            j = other.popleft()[1]
+            paired[i] = paired[j] = True
+        else:
+            unpaired[c].append((t, i))
+    return paired
+
+
+def make_txns(n_rows, n_amounts, seed=0):
+    """Return txns of random users, amounts, dates, and signs."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': rng.integers(0, n_rows // 50 + 1, n_rows),
+        'amount': rng.integers(1, n_amounts, n_rows).astype('float32') * 10,
+        'transaction_date': (pd.Timestamp('2020-01-01')
+                             + pd.to_timedelta(rng.integers(0, 365, n_rows),
+                                               unit='D')),
+        'credit_debit': rng.choice(['credit', 'debit'], n_rows),
+        'tag': None,
+    })
+
+
+def transfers(df):
+    return set(df.index[df.tag.eq('transfers')])
+
+
+def time_matchers(n_rows, group_size, window=432_000, seed=0):
+    """Time matchers on groups of txns spread over about four months.
+
+    Each round of the vectorised matcher drops the txns left unpaired at
+    the first break in each group, so it gains least on large groups.
+    """
+    rng = np.random.default_rng(seed)
+    group = np.sort(rng.integers(0, n_rows // group_size, n_rows))
+    secs = rng.integers(0, 10**7, n_rows)
+    secs = secs[np.lexsort((secs, group))]
+    credit = rng.random(n_rows) < 0.5
+    for func in [match_pairs_loop, match_pairs]:
+        start = time.perf_counter()
+        func(group, secs, credit, window)
+        print(f'{n_rows:>12,} candidates in groups of {group_size:>2}  '
+              f'{func.__name__}: '
+              f'{time.perf_counter() - start:6.2f}s')
+
+
+def main(sizes=(100_000, 1_000_000, 10_000_000)):
+    for n in sizes:
+        df = make_txns(n, n_amounts=2_000)
+        _, old_time = best_of(lambda: tag_pmt_pairs_knn(df.copy()))
+        _, new_time = best_of(lambda: tag_pmt_pairs(df.copy()))
+        print(f'{n:>12,} rows  knn loop: {old_time:6.2f}s  '
+              f'matcher: {new_time:6.2f}s  '
+              f'speedup: {old_time / new_time:4.1f}x')
+    for group_size in [4, 20]:
+        time_matchers(2_000_000, group_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Compare per-cell string converters with vectorised string normalisation."""
+
+import os
+import tempfile
+
+import pandas as pd
+
+from common import best_of, write_raw
+from mlbt import read_raw
+
+
+def read_with_converters(path):
+    """Previous implementation of `read_raw.read`."""
+    dtypes = {
+        'Transaction Reference': 'int32',
+        'User Reference': 'int32',
+        'Year of Birth': 'float32',
+        'Account Reference': 'int32',
+        'Latest Balance': 'float32',
+        'Amount': 'float32',
+    }
+    dates = [
+        'User Registration Date',
+        'Transaction Date',
+        'Account Created Date',
+        'Account Last Refreshed',
+    ]
+    strings = [
+        'Salary Range', 'Postcode', 'Derived Gender',
+        'Provider Group Name', 'Account Type', 'Transaction Description',
+        'Credit Debit', 'User Precedence Tag Name', 'Manual Tag Name',
+        'Auto Purpose Tag Name', 'Merchant Name', 'Merchant Business Line',
+    ]
+    str_cleaner = dict.fromkeys(strings, lambda x: x.lower().strip())
+    ignore = [
+        'LSOA', 'MSOA', 'Data Warehouse Date Last Updated',
+        'Transaction Updated Flag', 'Data Warehouse Date Created'
+    ]
+    return pd.read_csv(path, sep='|', parse_dates=dates,
+                       usecols=lambda c: c not in ignore, dtype=dtypes,
+                       converters=str_cleaner)
+
+
+def main(sizes=(100_000, 1_000_000)):
+    with tempfile.TemporaryDirectory() as tempdir:
+        for n in sizes:
+            path = write_raw(os.path.join(tempdir, f'raw_{n}.csv'), n)
+            old, old_time = best_of(lambda: read_with_converters(path))
+            new, new_time = best_of(lambda: read_raw.read(path))
+            pd.testing.assert_frame_equal(old, new)
+            print(f'{n:>12,} rows  converters: {old_time:6.2f}s  '
+                  f'vectorised: {new_time:6.2f}s  '
+                  f'speedup: {old_time / new_time:4.1f}x')
+
+
+if __name__ == '__main__':
+    main()
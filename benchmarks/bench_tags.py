@@ -0,0 +1,84 @@
+"""Time string cleaners with regexes evaluated per row and per unique value.
+
+Evaluating per row is emulated by patching `strings.Uniques` to apply string
+methods to the full column, as the cleaners did previously.
+"""
+
+import contextlib
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from common import best_of
+from mlbt import cleaners, config, strings
+
+
+CLEANERS = [
+    cleaners.clean_gender,
+    cleaners.clean_tags,
+    cleaners.tag_transfers,
+    cleaners.tag_incomes,
+    cleaners.tag_corrections,
+    cleaners.drop_card_repayments,
+]
+
+TAGS = [
+    'salary or wages (main)', 'salary or wages (other)', 'pension',
+    'benefits', 'rent', 'mortgage payment', 'credit card repayment',
+    'groceries', 'no tag', 'dividend', 'interest income', 'transfers',
+]
+
+
+class PerRow(strings.Uniques):
+    """Apply string methods to every row instead of unique values."""
+
+    def __init__(self, s):
+        self.s = s
+
+    def apply(self, func, na_value):
+        return func(self.s)
+
+
+@contextlib.contextmanager
+def per_row():
+    with mock.patch.object(strings, 'Uniques', PerRow):
+        yield
+
+
+def make_txns(n_rows, n_tags=300, n_descs=100_000, seed=0):
+    """Return txns with string columns of realistic cardinality."""
+    rng = np.random.default_rng(seed)
+    tags = TAGS + [f'tag {i} (misc)' for i in range(n_tags - len(TAGS))]
+    descs = ([f'tesco store {i}' for i in range(n_descs)]
+             + ['transfer to savings', 'trf fee', 'xfer 123'])
+    df = pd.DataFrame({
+        col: rng.choice(tags, n_rows) for col in ['up_tag', 'auto_tag',
+                                                  'manual_tag']
+    })
+    df['transaction_description'] = rng.choice(descs, n_rows)
+    df['credit_debit'] = rng.choice(['credit', 'debit'], n_rows)
+    df['account_type'] = rng.choice(['current', 'savings', 'credit card'],
+                                    n_rows)
+    df['gender'] = rng.choice(['m', 'f', 'u'], n_rows)
+    df['tag'] = None
+    return df
+
+
+def main(sizes=(1_000_000, 10_000_000)):
+    print(f'tag variable: {config.TAGVAR}')
+    for n in sizes:
+        df = make_txns(n)
+        print(f'{n:,} rows')
+        for cleaner in CLEANERS:
+            with per_row():
+                old, old_time = best_of(lambda: cleaner(df.copy()))
+            new, new_time = best_of(lambda: cleaner(df.copy()))
+            pd.testing.assert_frame_equal(old, new)
+            print(f'  {cleaner.__name__:<22} per row: {old_time:6.2f}s  '
+                  f'per unique: {new_time:6.2f}s  '
+                  f'speedup: {old_time / new_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
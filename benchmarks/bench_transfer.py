@@ -0,0 +1,75 @@
+"""Time returning cleaned pieces from workers pickled and through files.
+
+Workers build a frame shaped like a cleaned piece and return it either
+pickled through the result pipe or written to a memory-mapped Arrow file
+in shared memory. Both must give the same columns in the parent. Transfer
+cost is the time beyond that of workers building pieces and returning
+nothing.
+"""
+
+from concurrent import futures
+
+import numpy as np
+import pandas as pd
+
+from common import best_of
+from mlbt import make_data
+
+
+def make_piece(n_rows, seed=0):
+    """Return frame with dtypes of a cleaned piece."""
+    rng = np.random.default_rng(seed)
+    tags = np.array(['groceries', 'transfers', 'earnings_income', 'rent'])
+    return pd.DataFrame({
+        'user_id': np.sort(rng.integers(0, n_rows // 500 + 1, n_rows))
+                     .astype('int32'),
+        'transaction_date': (pd.Timestamp('2015-01-01')
+                             + pd.to_timedelta(rng.integers(0, 2_000, n_rows),
+                                               unit='D')),
+        'amount': rng.lognormal(3, 1, n_rows).astype('float32'),
+        'account_id': rng.integers(0, 10**6, n_rows).astype('int32'),
+        'ym': rng.integers(201201, 202006, n_rows),
+        'tag': pd.Categorical(rng.choice(tags, n_rows)),
+        'merchant_name': rng.choice(['tesco', 'amazon', 'tfl', ''], n_rows)
+                           .astype(object),
+        'latest_balance': rng.normal(1000, 500, n_rows).astype('float32'),
+    }), {}
+
+
+def build_only(n_rows, seed=0):
+    make_piece(n_rows, seed)
+    return {}, {}
+
+
+def transfer(n_rows, n_pieces, shared, func=make_piece):
+    """Return pieces built by func in workers."""
+    with make_data.result_dir(shared) as out_dir:
+        with futures.ProcessPoolExecutor() as pool:
+            todo = [pool.submit(make_data.clean_columns, func, n_rows, seed,
+                                out_dir=out_dir)
+                    for seed in range(n_pieces)]
+            pieces = []
+            for future in todo:
+                piece, _ = future.result()
+                if isinstance(piece, str):
+                    piece = make_data.load_columns(piece)
+                pieces.append(piece)
+    return pieces
+
+
+def main(sizes=(1_000_000, 3_000_000), n_pieces=4):
+    for n in sizes:
+        _, base_time = best_of(
+            lambda: transfer(n, n_pieces, False, build_only))
+        old, old_time = best_of(lambda: transfer(n, n_pieces, False))
+        new, new_time = best_of(lambda: transfer(n, n_pieces, True))
+        for a, b in zip(old, new):
+            pd.testing.assert_frame_equal(pd.DataFrame(a), pd.DataFrame(b))
+        old_time, new_time = old_time - base_time, new_time - base_time
+        print(f'{n_pieces} pieces of {n:>10,} rows  transfer  '
+              f'pickled: {old_time:6.2f}s  shared: {new_time:6.2f}s  '
+              f'speedup: {old_time / new_time:4.1f}x')
+
+
+if __name__ == '__main__':
+    main()
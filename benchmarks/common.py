@@ -0,0 +1,56 @@
+"""Shared helpers for benchmark scripts.
+
+Run scripts from the repository root, e.g. `python benchmarks/bench_read.py`.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'preproc'))
+
+
+RAW_COLUMNS = [
+    'Transaction Reference', 'User Reference', 'Year of Birth',
+    'Salary Range', 'Postcode', 'LSOA', 'MSOA', 'Derived Gender',
+    'User Registration Date', 'Account Reference', 'Provider Group Name',
+    'Account Type', 'Latest Balance', 'Account Created Date',
+    'Account Last Refreshed', 'Transaction Date', 'Amount',
+    'Transaction Description', 'Credit Debit', 'Auto Purpose Tag Name',
+    'Manual Tag Name', 'User Precedence Tag Name', 'Merchant Name',
+    'Merchant Business Line', 'Data Warehouse Date Created',
+    'Data Warehouse Date Last Updated', 'Transaction Updated Flag',
+]
+
+
+def best_of(func, repeat=3):
+    """Return result of func and best wall time in seconds over repeat runs."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def write_raw(path, n_rows, seed=0):
+    """Write pipe-delimited file with raw extract schema and random values."""
+    rng = np.random.default_rng(seed)
+    words = np.array(['Salary', 'Rent ', ' TESCO', 'Transfer', 'No Tag', ''])
+    dates = pd.date_range('2012-01-01', '2020-06-30').strftime('%Y-%m-%d')
+    df = pd.DataFrame({col: rng.choice(words, n_rows) for col in RAW_COLUMNS})
+    df['Transaction Reference'] = np.arange(n_rows)
+    users = np.sort(rng.integers(1, n_rows // 100 + 2, n_rows))
+    df['User Reference'] = users
+    df['Account Reference'] = users * 10 + rng.integers(0, 3, n_rows)
+    df['Year of Birth'] = rng.integers(1940, 2000, n_rows)
+    df['Latest Balance'] = rng.normal(1000, 500, n_rows).round(2)
+    df['Amount'] = rng.lognormal(3, 1.5, n_rows).round(2)
+    for col in RAW_COLUMNS:
+        if 'Date' in col or 'Refreshed' in col:
+            df[col] = rng.choice(dates, n_rows)
+    df.to_csv(path, sep='|', index=False)
+    return path
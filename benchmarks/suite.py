@@ -0,0 +1,166 @@
+"""Time reading, each step, and end-to-end cleaning on synthetic data.
+
+For each size, a synthetic raw file is written (see `synthetic`) unless it
+exists in the data directory, and the suite times `read_raw`, each
+registered cleaner and selector run in turn on the full data, and
+`split_file` followed by `clean_data`. Steps run on the full data, which
+at 100M rows needs a machine with well over 100GB of memory.
+
+Results are saved as JSON named after the current commit so that runs of
+different commits can be compared with --compare.
+
+Usage: python benchmarks/suite.py [--sizes N ...] [--compare OLD NEW]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+
+import synthetic
+# importing cleaners and selectors registers them
+from mlbt import cleaners, make_data, selectors
+from mlbt.decorators import cleaner_funcs, count, selector_funcs
+from mlbt.read_raw import read_raw
+
+
+HERE = os.path.dirname(__file__)
+SIZES = [1_000_000, 10_000_000, 100_000_000]
+
+
+def commit():
+    """Return hash of current commit, marked if there are local changes."""
+    def git(*args):
+        return subprocess.run(['git', '-C', HERE, *args], capture_output=True,
+                              text=True).stdout.strip()
+    sha = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    return sha + ('-dirty' if git('status', '--porcelain', '--', '..')
+                  else '')
+
+
+def data_file(data_dir, n_rows, seed):
+    """Return path of synthetic raw file, writing it if missing."""
+    path = os.path.join(data_dir, f'mdb_{n_rows}_{seed}.csv')
+    if not os.path.exists(path):
+        print(f'writing {path}...')
+        os.makedirs(data_dir, exist_ok=True)
+        synthetic.generate(path + '.tmp', n_rows, seed)
+        os.rename(path + '.tmp', path)
+    return path
+
+
+def timed(func, *args):
+    """Return result of func and wall time in seconds."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def time_steps(df, funcs):
+    """Run funcs in turn and return the result and time of each."""
+    times = {}
+    for func in funcs:
+        df, times[func.__name__] = timed(func, df)
+    return df, times
+
+
+def run_size(path):
+    """Return timings for raw file at path."""
+    count.clear()
+    df, read_time = timed(read_raw, path)
+    result = {'rows': len(df), 'read': read_time}
+    df, result['cleaners'] = time_steps(df, cleaner_funcs)
+    _, result['selectors'] = time_steps(df, selector_funcs)
+    del df
+    count.clear()
+    with tempfile.TemporaryDirectory() as tempdir:
+        pieces, result['split_file'] = timed(make_data.split_file, path,
+                                             tempdir)
+        _, result['clean_data'] = timed(make_data.clean_data.__wrapped__,
+                                        pieces)
+    return result
+
+
+def flatten(result):
+    """Return timings of a size as flat Series."""
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update({f'{key}.{k}': v for k, v in value.items()})
+        elif key != 'rows':
+            flat[key] = value
+    return pd.Series(flat)
+
+
+def compare(old_path, new_path):
+    """Print timings of two runs side by side."""
+    runs = []
+    for path in [old_path, new_path]:
+        with open(path) as f:
+            runs.append(json.load(f))
+    old, new = runs
+    for size in new['results']:
+        if size not in old['results']:
+            continue
+        table = pd.DataFrame({
+            f'old {old["commit"]}': flatten(old['results'][size]),
+            f'new {new["commit"]}': flatten(new['results'][size]),
+        })
+        table['speedup'] = table.iloc[:, 0] / table.iloc[:, 1]
+        print(f'{int(size):,} rows')
+        with pd.option_context('display.max_rows', None):
+            print(table.round(3))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes', nargs='+', type=int, default=SIZES,
+        help='approximate numbers of rows of synthetic data.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--data-dir', default=os.path.join(tempfile.gettempdir(), 'mdb'),
+        help='directory of synthetic raw files, written if missing.')
+    parser.add_argument(
+        '--out', default=os.path.join(HERE, 'results'),
+        help='directory to save results in.')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='print results of two runs side by side instead.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        return compare(*args.compare)
+    run = {
+        'commit': commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'results': {},
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out = os.path.join(args.out, f'{run["commit"]}.json')
+    for n_rows in args.sizes:
+        path = data_file(args.data_dir, n_rows, args.seed)
+        print(f'{n_rows:,} rows...')
+        run['results'][n_rows] = run_size(path)
+        # save after each size, as large sizes take long
+        with open(out, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(flatten(run['results'][n_rows]).round(3).to_string())
+    print(f'{out} written.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""Write synthetic raw extracts in the schema of the MDB data.
+
+Users have one to five accounts at one bank, observation windows of six
+months to six years, regular monthly incomes, daily spending, transfers
+between their own accounts, and credit card repayments. Tags follow the
+raw vocabularies, including untagged txns and manual tags that override
+auto tags. As in the raw extracts, rows are grouped by user and all fields
+are quoted.
+
+Usage: python benchmarks/synthetic.py PATH N_ROWS [--seed SEED]
+"""
+
+import argparse
+import csv
+
+import numpy as np
+import pandas as pd
+
+from common import RAW_COLUMNS
+
+
+EXTRACT_DATE = pd.Timestamp('2020-07-31')
+
+BANKS = ['Barclays', 'HSBC', 'Lloyds Bank', 'Natwest', 'Santander',
+         'Nationwide', 'Halifax', 'Monzo', 'TSB', 'First Direct']
+SALARY_RANGES = ['< 10k', '10k to 20k', '20k to 30k', '30k to 40k',
+                 '40k to 50k', '50k to 60k', '60k to 70k', '70k to 80k',
+                 '> 80k']
+
+# auto tag, merchant business line, and merchants of spending txns
+SPENDING = [
+    ('Groceries', 'Supermarkets', ['TESCO STORES', 'SAINSBURYS', 'ASDA',
+                                   'LIDL', 'ALDI', 'WAITROSE']),
+    ('Eating out', 'Restaurants', ['PRET A MANGER', 'NANDOS', 'GREGGS',
+                                   'COSTA COFFEE']),
+    ('Fuel', 'Petrol Stations', ['SHELL', 'BP', 'ESSO']),
+    ('Clothes', 'Clothing Retail', ['PRIMARK', 'NEXT', 'H&M', 'ZARA']),
+    ('Entertainment', 'Entertainment', ['NETFLIX', 'SPOTIFY', 'ODEON']),
+    ('Household', 'Home Improvement', ['B&Q', 'IKEA', 'ARGOS']),
+    ('Travel', 'Transport', ['TFL TRAVEL', 'TRAINLINE', 'UBER']),
+    ('Utilities', 'Utilities', ['BRITISH GAS', 'THAMES WATER', 'EDF']),
+    ('Mobile phone', 'Telecoms', ['VODAFONE', 'EE', 'O2']),
+    ('Cash', 'Cash', ['CASH WITHDRAWAL']),
+    ('No tag', '', ['CARD PAYMENT', 'POS']),
+]
+MONTHLY_DEBITS = [('Rent', 'LETTINGS'), ('Mortgage payment', 'MORTGAGE')]
+INCOMES = [
+    ('Salary or wages (main)', 0.8, 7.6, 'SALARY'),
+    ('Benefits', 0.15, 5.5, 'DWP'),
+    ('Pension', 0.1, 6.5, 'PENSION'),
+    ('Interest income', 0.3, 1.0, 'INTEREST'),
+]
+MANUAL_TAGS = ['Groceries', 'Eating out', 'Household', 'Transfers',
+               'Salary or wages (other)', 'Rent']
+
+
+def users(rng, first_id, n):
+    """Return table of users."""
+    n_months = rng.integers(6, 73, n)
+    start = EXTRACT_DATE - pd.to_timedelta(n_months * 30.4, unit='D')
+    return pd.DataFrame({
+        'user_id': np.arange(first_id, first_id + n),
+        'Year of Birth': pd.array(np.where(rng.random(n) < .02, np.nan,
+                                           rng.integers(1940, 2003, n)),
+                                  dtype='Int64'),
+        'Salary Range': np.where(rng.random(n) < .3, '',
+                                 rng.choice(SALARY_RANGES, n)),
+        'Postcode': [f'{a}{d} {e}' for a, d, e in zip(
+            rng.choice(['SW', 'N', 'E', 'M', 'B', 'LS', 'EH', 'CF'], n),
+            rng.integers(1, 30, n), rng.integers(1, 10, n))],
+        'LSOA': [f'E0{i:07d}' for i in rng.integers(0, 33_000, n)],
+        'MSOA': [f'E02{i:06d}' for i in rng.integers(0, 6_800, n)],
+        'Derived Gender': rng.choice(['M', 'F', 'U'], n, p=[.48, .48, .04]),
+        'User Registration Date': start.normalize(),
+        'start': start.to_numpy(),
+        'n_months': n_months,
+        'bank': rng.choice(BANKS, n),
+    })
+
+
+def accounts(rng, user, first_id):
+    """Return table of accounts, the first of each user a current account."""
+    n_accounts = rng.integers(1, 6, len(user))
+    acc = user.loc[user.index.repeat(n_accounts)].reset_index(drop=True)
+    is_first = ~acc.user_id.duplicated().to_numpy()
+    other = rng.choice(['Current', 'Savings', 'Credit card'], len(acc),
+                       p=[.2, .5, .3])
+    acc['Account Type'] = np.where(is_first, 'Current', other)
+    acc['Account Reference'] = np.arange(first_id, first_id + len(acc))
+    acc['Provider Group Name'] = np.where(rng.random(len(acc)) < .8,
+                                          acc.bank,
+                                          rng.choice(BANKS, len(acc)))
+    acc['Latest Balance'] = rng.normal(1_500, 2_000, len(acc)).round(2)
+    created = acc.start - pd.to_timedelta(rng.integers(0, 3_000, len(acc)),
+                                          unit='D')
+    acc['Account Created Date'] = created.dt.normalize()
+    refreshed = EXTRACT_DATE - pd.to_timedelta(rng.integers(0, 30, len(acc)),
+                                               unit='D')
+    acc['Account Last Refreshed'] = refreshed
+    return acc
+
+
+def spending(rng, user, current, txns_per_month):
+    """Return debits on current accounts at random dates."""
+    n_txns = rng.poisson(user.n_months * txns_per_month)
+    idx = np.repeat(np.arange(len(user)), n_txns)
+    n = len(idx)
+    category = rng.integers(0, len(SPENDING), n)
+    merchant = np.empty(n, dtype=object)
+    for i, (_, _, merchants) in enumerate(SPENDING):
+        is_cat = category == i
+        merchant[is_cat] = rng.choice(merchants, is_cat.sum())
+    return pd.DataFrame({
+        'idx': idx,
+        'offset': rng.random(n) * user.n_months.to_numpy()[idx] * 30.4,
+        'account': current[idx],
+        'Amount': rng.lognormal(2.6, 1, n).round(2),
+        'Credit Debit': 'Debit',
+        'tag': np.array([t for t, _, _ in SPENDING])[category],
+        'Merchant Name': merchant,
+        'Merchant Business Line': np.array([b for _, b, _ in SPENDING])[
+            category],
+        'Transaction Description': [
+            f'{m} {s}' for m, s in zip(merchant, rng.integers(1, 9999, n))],
+    })
+
+
+def monthly(rng, user, current, share, amount, tag, desc, credit):
+    """Return monthly payments of a share of users with fixed amounts."""
+    has = rng.random(len(user)) < share
+    n_months = np.where(has, user.n_months, 0)
+    idx = np.repeat(np.arange(len(user)), n_months)
+    month = np.arange(len(idx)) - np.repeat(np.cumsum(n_months) - n_months,
+                                            n_months)
+    day = rng.integers(0, 28, len(user))
+    jitter = rng.integers(-2, 3, len(idx))
+    pay = amount[idx] * rng.normal(1, .03, len(idx))
+    return pd.DataFrame({
+        'idx': idx,
+        'offset': np.clip(month * 30.4 + day[idx] + jitter, 0, None),
+        'account': current[idx],
+        'Amount': pay.round(2),
+        'Credit Debit': 'Credit' if credit else 'Debit',
+        'tag': tag,
+        'Merchant Name': '',
+        'Merchant Business Line': '',
+        'Transaction Description': desc,
+    })
+
+
+def pairs(rng, user, current, other, per_month, tag, desc, max_days=3):
+    """Return payments from current to other accounts and their receipts.
+
+    Users without another account make no such payments.
+    """
+    n_pairs = rng.poisson(user.n_months * per_month)
+    n_pairs = np.where(other >= 0, n_pairs, 0)
+    idx = np.repeat(np.arange(len(user)), n_pairs)
+    n = len(idx)
+    offset = rng.random(n) * user.n_months.to_numpy()[idx] * 30.4
+    amount = rng.lognormal(5, 1, n).round(0)
+    out = pd.DataFrame({
+        'idx': idx, 'offset': offset, 'account': current[idx],
+        'Amount': amount, 'Credit Debit': 'Debit', 'tag': tag,
+        'Merchant Name': '', 'Merchant Business Line': '',
+        'Transaction Description': desc,
+    })
+    receipt = out.assign(
+        offset=offset + rng.integers(0, max_days + 1, n),
+        account=other[idx], **{'Credit Debit': 'Credit'})
+    return pd.concat([out, receipt], ignore_index=True)
+
+
+def other_account(rng, acc, types):
+    """Return one account of each user with a type in types, or -1."""
+    cands = acc[acc['Account Type'].isin(types)]
+    cands = cands.sample(frac=1, random_state=rng.integers(2**31))
+    first = cands.drop_duplicates('user_id').set_index('user_id')
+    return (first['Account Reference']
+            .reindex(acc.user_id.unique(), fill_value=-1).to_numpy())
+
+
+def chunk(rng, first_user, n_users, first_account, txns_per_month):
+    """Return raw rows of n_users users."""
+    user = users(rng, first_user, n_users)
+    acc = accounts(rng, user, first_account)
+    current = acc.drop_duplicates('user_id')['Account Reference'].to_numpy()
+    savings = other_account(rng, acc, ['Savings'])
+    card = other_account(rng, acc, ['Credit card'])
+    parts = [spending(rng, user, current, txns_per_month)]
+    for tag, share, size, desc in INCOMES:
+        amount = rng.lognormal(size, .5, n_users)
+        parts.append(monthly(rng, user, current, share, amount, tag,
+                             f'{desc} {tag.split()[0].upper()}',
+                             credit=True))
+    for tag, desc in MONTHLY_DEBITS:
+        amount = rng.lognormal(6.8, .4, n_users)
+        parts.append(monthly(rng, user, current, .35, amount, tag,
+                             f'{desc} DD', credit=False))
+    parts.append(pairs(rng, user, current, savings, 1.5, 'Transfers',
+                       'TFR TO SAVINGS'))
+    parts.append(pairs(rng, user, current, card, 1, 'Credit card repayment',
+                       'CARD PAYMENT THANK YOU'))
+    txns = pd.concat(parts, ignore_index=True)
+    n = len(txns)
+
+    # auto tags, occasionally missing; manual tags override them
+    auto = np.where(rng.random(n) < .03, 'No tag', txns.tag)
+    manual = np.where(rng.random(n) < .04, rng.choice(MANUAL_TAGS, n),
+                      'No tag')
+    up = np.where(manual != 'No tag', manual, auto)
+    # up tag not always set as it should be
+    up = np.where(rng.random(n) < .01, auto, up)
+    start = user.start.to_numpy()[txns.idx]
+    date = start + pd.to_timedelta(txns.offset, unit='D').to_numpy()
+    date = np.minimum(date, EXTRACT_DATE.to_datetime64())
+    txns = txns.assign(**{
+        'Transaction Date': pd.DatetimeIndex(date).normalize(),
+        'Auto Purpose Tag Name': auto,
+        'Manual Tag Name': manual,
+        'User Precedence Tag Name': up,
+    })
+    txns['user_id'] = user.user_id.to_numpy()[txns.idx]
+    txns = txns.drop(columns=['idx', 'tag', 'offset'])
+    txns = (txns
+            .merge(user.drop(columns=['start', 'n_months', 'bank']),
+                   on='user_id')
+            .merge(acc[['Account Reference', 'Account Type',
+                        'Provider Group Name', 'Latest Balance',
+                        'Account Created Date', 'Account Last Refreshed']],
+                   left_on='account', right_on='Account Reference'))
+    txns = txns.sort_values(['user_id', 'Transaction Date'],
+                            kind='stable', ignore_index=True)
+    txns['User Reference'] = txns.user_id
+    created = txns['Transaction Date'] + pd.to_timedelta(
+        rng.integers(1, 5, len(txns)), unit='D')
+    txns['Data Warehouse Date Created'] = created
+    txns['Data Warehouse Date Last Updated'] = created
+    txns['Transaction Updated Flag'] = np.where(
+        rng.random(len(txns)) < .01, 'Y', 'N')
+    return txns, acc['Account Reference'].max() + 1
+
+
+def generate(path, n_rows, seed=0, txns_per_month=40, chunk_users=1_000):
+    """Write about n_rows rows of whole users to path and return path."""
+    rng = np.random.default_rng(seed)
+    written, first_user, first_account = 0, 1, 1
+    with open(path, 'w') as f:
+        while written < n_rows:
+            txns, first_account = chunk(rng, first_user, chunk_users,
+                                        first_account, txns_per_month)
+            # stop after the user that crosses n_rows
+            last = txns.user_id.iloc[min(n_rows - written, len(txns)) - 1]
+            txns = txns[txns.user_id <= last]
+            txns['Transaction Reference'] = np.arange(
+                written + 1, written + len(txns) + 1)
+            txns[RAW_COLUMNS].to_csv(f, sep='|', index=False,
+                                     header=written == 0,
+                                     quoting=csv.QUOTE_ALL,
+                                     date_format='%Y-%m-%d')
+            written += len(txns)
+            first_user += chunk_users
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='path of file to write.')
+    parser.add_argument('n_rows', type=int, help='approximate number of rows.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.path, args.n_rows, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,139 @@
 import argparse
+import contextlib
+import io
 import os
 import platform
+import threading
+import time
+from concurrent import futures
+
+import fsspec
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import s3fs
 
 
+# seconds for which directory listings and file info are cached
+LISTINGS_TTL = 300
+
+# maximum number of pooled connections per s3 filesystem
+MAX_CONNECTIONS = 64
+
+# threads and attempts per object used by batch helpers
+MAX_WORKERS = 16
+RETRIES = 3
+
+_filesystems = {}
+_info = {}
+_lock = threading.Lock()
+
+
 def get_aws_profile():
     """Return name of AWS profile to use for S3 access.
+
+    Uses the `AWS_PROFILE` environment variable if set, and the project
+    profile on the machine it is set up on. Otherwise returns None, which
+    uses the default credentials (e.g. of an instance role).
     """
+    if 'AWS_PROFILE' in os.environ:
+        return os.environ['AWS_PROFILE']
     if platform.node() == 'FabsMacBook.local':
-        profile = 'tracker-fgu'
+        return 'tracker-fgu'
+    return None
+
+
+def filesystem(path='', profile=None):
+    """Return shared filesystem for the protocol of path.
+
+    One filesystem is created per process, protocol, and profile, and
+    reused by all later calls so that they share its session, connection
+    pool, and listings cache. Supports s3, local paths, and fsspec's
+    in-memory filesystem (`memory://`), which is useful for tests.
+    """
+    protocol = fsspec.utils.get_protocol(path)
+    if protocol == 's3' and profile is None:
+        profile = get_aws_profile()
+    key = (os.getpid(), protocol, profile)
+    with _lock:
+        if key not in _filesystems:
+            if protocol == 's3':
+                fs = s3fs.S3FileSystem(
+                    profile=profile, skip_instance_cache=True,
+                    use_listings_cache=True,
+                    listings_expiry_time=LISTINGS_TTL,
+                    config_kwargs=dict(max_pool_connections=MAX_CONNECTIONS))
+            else:
+                fs = fsspec.filesystem(protocol)
+            _filesystems[key] = fs
+        return _filesystems[key]
+
+
+def info(path, profile=None):
+    """Return info (e.g. size) of file on path.
+
+    Info of s3 objects is cached for `LISTINGS_TTL` seconds or until the
+    object is written using the helpers in this module. Other files can
+    grow in place and are cheap to stat, so their info is never cached.
+    """
+    if fsspec.utils.get_protocol(path) != 's3':
+        return filesystem(path, profile).info(path)
+    key = (path, profile)
+    now = time.monotonic()
+    if key not in _info or now - _info[key][0] > LISTINGS_TTL:
+        _info[key] = now, filesystem(path, profile).info(path)
+    return _info[key][1]
+
+
+def invalidate(path, profile=None):
+    """Drop cached listings and info of path and any files below it."""
+    filesystem(path, profile).invalidate_cache(path)
+    for key in [k for k in list(_info) if k[0].startswith(path)]:
+        _info.pop(key, None)
 
-    return profile
+
+def ls(path, profile=None):
+    """Return paths in directory, using cached listings."""
+    return filesystem(path, profile).ls(path, detail=False)
 
 
 class bucket_manager:
     """Helper class to easily manage project bucket.
     
-    Instantiate manager with a bucket name, and it will
-    automatically set up a file system instance with the
-    appropriate aws profile, using `get_aws_profile`.
+    Instantiate manager with a bucket name, and it will use the shared
+    file system instance with the appropriate aws profile, using
+    `get_aws_profile`.
     """
     
     def __init__(self, bucket_name):
         self.basepath = os.path.join('s3://', bucket_name)
         self.profile = get_aws_profile()
-        self.fs = s3fs.S3FileSystem(profile = self.profile)
+        self.fs = filesystem(self.basepath, self.profile)
     
     def list_raw(self):
         path = os.path.join(self.basepath, 'raw')
-        display(self.fs.ls(path))
+        display(ls(path, self.profile))
         
     def list_clean(self):
         path = os.path.join(self.basepath, 'clean')
-        display(self.fs.ls(path))
+        display(ls(path, self.profile))
 
 
 def s3read_csv(path, profile=None, **kwargs):
     """Read from s3 path.
 
-    Uses appropriate aws profile as specified in `get_aws_profile`.
+    Uses shared file system of appropriate aws profile (see `filesystem`).
+    With `chunksize` or `iterator`, returns a reader that reads after this
+    function returns, so the file is opened by pandas with the options of
+    the shared file system and closed when the reader is closed.
     """
-    if profile is None:
-        profile = get_aws_profile()
-    options = dict(storage_options=dict(profile=profile))
-
-    df = pd.read_csv(path, **options, **kwargs)
+    fs = filesystem(path, profile)
+    if kwargs.get('chunksize') or kwargs.get('iterator'):
+        if fsspec.utils.get_protocol(path) != 'file':
+            kwargs['storage_options'] = fs.storage_options
+        return pd.read_csv(path, **kwargs)
+    with fs.open(path, 'rb', compression='infer') as f:
+        df = pd.read_csv(f, **kwargs)
 
     return df
 
@@ -53,13 +141,12 @@ def s3read_csv(path, profile=None, **kwargs):
 def s3write_csv(df, path, profile=None, **kwargs):
     """Write df to s3 path.
 
-    Uses appropriate aws profile as specified in `get_aws_profile`.
+    Uses shared file system of appropriate aws profile (see `filesystem`).
     """
-    if profile is None:
-        profile = get_aws_profile()
-    options = dict(storage_options=dict(profile=profile))
-
-    df.to_csv(path, index=False, **options, **kwargs)
+    fs = filesystem(path, profile)
+    with fs.open(path, 'w', compression='infer') as f:
+        df.to_csv(f, index=False, **kwargs)
+    invalidate(path, profile)
     print(f'{path} (of shape {df.shape}) written.')
 
     return df
@@ -68,13 +155,11 @@ def s3write_csv(df, path, profile=None, **kwargs):
 def s3read_parquet(path, profile=None, **kwargs):
     """Read from s3 path.
 
-    Uses appropriate aws profile as specified in `get_aws_profile`.
+    Uses shared file system of appropriate aws profile (see `filesystem`).
     """
-    if profile is None:
-        profile = get_aws_profile()
-    options = dict(storage_options=dict(profile=profile))
+    fs = filesystem(path, profile)
 
-    df = pd.read_parquet(path, **options, **kwargs)
+    df = pd.read_parquet(path, filesystem=fs, **kwargs)
 
     return df
 
@@ -82,18 +167,167 @@ def s3read_parquet(path, profile=None, **kwargs):
 def s3write_parquet(df, path, profile=None, **kwargs):
     """Write df to s3 path.
 
-    Uses appropriate aws profile as specified in `get_aws_profile`.
+    Uses shared file system of appropriate aws profile (see `filesystem`).
     """
-    if profile is None:
-        profile = get_aws_profile()
-    options = dict(storage_options=dict(profile=profile))
+    fs = filesystem(path, profile)
 
-    df.to_parquet(path, index=False, **options, **kwargs)
+    df.to_parquet(path, index=False, filesystem=fs, **kwargs)
+    invalidate(path, profile)
     print(f'{path} (of shape {df.shape}) written.')
 
     return df
 
 
+def s3write_parquet_dataset(df, path, partition_cols, profile=None,
+                            row_group_size=1_000_000, append=False,
+                            **kwargs):
+    """Write df to hive-partitioned parquet dataset on s3 path.
+
+    Categorical columns are dictionary encoded, and a `_metadata` summary
+    file is written so readers can prune partitions and row groups without
+    opening every file. Partitions in df replace existing ones. With
+    `append`, other existing partitions are kept and included in
+    `_metadata`.
+    """
+    fs = filesystem(path, profile)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    cats = list(df.select_dtypes('category').columns)
+    collector = []
+    pq.write_to_dataset(table, path, partition_cols=partition_cols,
+                        filesystem=fs, metadata_collector=collector,
+                        max_rows_per_group=row_group_size,
+                        use_dictionary=cats,
+                        existing_data_behavior='delete_matching', **kwargs)
+    if append:
+        collector = []
+        root = fsspec.core.strip_protocol(path)
+        for fp in sorted(fs.glob(os.path.join(root, '**', '*.parquet'))):
+            metadata = pq.read_metadata(fp, filesystem=fs)
+            metadata.set_file_path(os.path.relpath(fp, root))
+            collector.append(metadata)
+    schema = pa.schema(f for f in table.schema if f.name not in partition_cols)
+    pq.write_metadata(schema, os.path.join(path, '_metadata'),
+                      metadata_collector=collector, filesystem=fs)
+    invalidate(path, profile)
+    print(f'{path} (of shape {df.shape}, partitioned by '
+          f'{partition_cols}) written.')
+
+    return df
+
+
+def s3open(path, mode='rb', profile=None):
+    """Open file object on s3 path.
+
+    Uses shared file system of appropriate aws profile (see `filesystem`).
+    """
+    fs = filesystem(path, profile)
+    if mode[0] in 'wa':
+        invalidate(path, profile)
+
+    return fs.open(path, mode)
+
+
+def transient(error):
+    """Return True if error is worth retrying (e.g. timeout, throttling)."""
+    permanent = (FileNotFoundError, PermissionError, IsADirectoryError,
+                 NotADirectoryError)
+    return isinstance(error, OSError) and not isinstance(error, permanent)
+
+
+def retry(func, *args, retries=RETRIES, **kwargs):
+    """Call func, retrying transient errors with exponential backoff."""
+    for attempt in range(retries):
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            if attempt == retries - 1 or not transient(error):
+                raise
+            time.sleep(2 ** attempt)
+
+
+def run_many(func, tasks, max_workers):
+    """Run func(*task) for each task in a thread pool, with retries.
+
+    Returns results in order of tasks.
+    """
+    with futures.ThreadPoolExecutor(max_workers) as pool:
+        jobs = [pool.submit(retry, func, *task) for task in tasks]
+        return [job.result() for job in jobs]
+
+
+def throughput(action, n_bytes, n_files, seconds):
+    """Print aggregate throughput of a batch read or write."""
+    mb = n_bytes / 2**20
+    print(f'{action} {n_files} files of {mb:,.1f} MB in {seconds:.2f}s '
+          f'({mb / max(seconds, 1e-9):,.1f} MB/s).')
+
+
+def compression(path, f, mode):
+    """Return context of f wrapped to (de)compress by suffix of path.
+
+    Leaves f open.
+    """
+    codec = fsspec.utils.infer_compression(path)
+    if codec is None:
+        return contextlib.nullcontext(f)
+    return fsspec.compression.compr[codec](f, mode=mode)
+
+
+def s3read_many(paths, reader=pd.read_parquet, profile=None,
+                max_workers=MAX_WORKERS, **kwargs):
+    """Read files on paths concurrently.
+
+    Each file is downloaded whole, decompressed by its suffix (e.g. `.gz`),
+    and parsed from memory by reader (e.g. `pd.read_parquet` or
+    `pd.read_csv`), with kwargs passed on. It is downloaded again if that
+    fails with a transient error. Returns list of dataframes in order of
+    paths and prints the throughput of the batch.
+    """
+    def read(path):
+        data = filesystem(path, profile).cat_file(path)
+        with compression(path, io.BytesIO(data), 'rb') as f:
+            return len(data), reader(f, **kwargs)
+
+    paths = list(paths)
+    start = time.perf_counter()
+    results = run_many(read, [(path,) for path in paths], max_workers)
+    seconds = time.perf_counter() - start
+    throughput('read', sum(n for n, _ in results), len(paths), seconds)
+
+    return [df for _, df in results]
+
+
+def s3write_many(dfs, paths, writer=pd.DataFrame.to_parquet, profile=None,
+                 max_workers=MAX_WORKERS, **kwargs):
+    """Write each of dfs to its path concurrently.
+
+    Each df is serialised in memory by writer (e.g.
+    `pd.DataFrame.to_parquet` or `pd.DataFrame.to_csv`), with kwargs passed
+    on and without the index, compressed by the suffix of its path, and
+    uploaded whole. It is uploaded again if that fails with a transient
+    error. Prints the throughput of the batch and returns list of dfs.
+    """
+    kwargs = {'index': False, **kwargs}
+
+    def write(df, path):
+        buffer = io.BytesIO()
+        with compression(path, buffer, 'wb') as f:
+            writer(df, f, **kwargs)
+        data = buffer.getvalue()
+        filesystem(path, profile).pipe_file(path, data)
+        invalidate(path, profile)
+        return len(data)
+
+    dfs, paths = list(dfs), list(paths)
+    start = time.perf_counter()
+    sizes = run_many(write, list(zip(dfs, paths)), max_workers)
+    seconds = time.perf_counter() - start
+    throughput('wrote', sum(sizes), len(paths), seconds)
+
+    return dfs
+
+
 def s3fetch_ons():
     """Fetch ONS area lookup table."""
     nspl_version = 'NSPL_AUG_2020_UK'
@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-from decorators import cleaner
+from decorators import cleaner, full_data
 
 @cleaner
 def clean_names(df):
@@ -39,6 +39,7 @@ def add_variables(df):
 
 
 # @cleaner
+@full_data
 def drop_last_month(df):
     """Drop last month, which might have missing data.
     For first month, Jan 2012, we have complete data.
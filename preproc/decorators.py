@@ -8,9 +8,26 @@ cleaner_funcs = []
 selector_funcs = []
 
 
-def cleaner(func):
-    """Add function to list of cleaner functions."""
-    cleaner_funcs.append(func)
+def cleaner(func=None, *, chunk_safe=True):
+    """Add function to list of cleaner functions.
+
+    Set `chunk_safe=False` (or use `full_data`) for cleaners that need the
+    full dataset rather than all rows of a subset of users (e.g.
+    `drop_last_month`), which prevents the pipeline from running in chunked
+    mode.
+    """
+    def register(func):
+        func.chunk_safe = getattr(func, 'chunk_safe', True) and chunk_safe
+        cleaner_funcs.append(func)
+        return func
+    if func is None:
+        return register
+    return register(func)
+
+
+def full_data(func):
+    """Mark cleaner as needing the full dataset (see `cleaner`)."""
+    func.chunk_safe = False
     return func
 
 
@@ -1,24 +1,45 @@
 #!/usr/bin/env python3
 
 import argparse
+import collections
+import resource
 import sys
 
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 import aws
 import cleaners
 import decorators
 
 
+USER_COL = 'User Reference'
+
+# Cleaners create temporary copies of the data they work on, so a chunk
+# can only use a fraction of the memory budget.
+COPIES_PER_CHUNK = 4
+
+
 def parse_args(argv):
     parser = argparse.ArgumentParser()
     parser.add_argument('inpath', help='path to input file')
     parser.add_argument('outpath', help='path to output file')
+    parser.add_argument(
+        '-c', '--chunked', action='store_true',
+        help='read, clean, and write data in chunks of users.')
+    parser.add_argument(
+        '-m', '--memory-budget', type=int, default=2_000,
+        help='memory budget in MB per chunk in chunked mode.')
     return parser.parse_args()
 
 
-def read(inpath, **kwargs):
+def read(inpath, strings=False, **kwargs):
     """Read unprocessed input data.
 
-    Set column types if necessary to save memory.
+    Set column types if necessary to save memory. With `strings`, read all
+    other columns except dates as strings, so that every chunk of a chunked
+    read has the same column types, even if a column is empty in some.
     """
     dtypes = {
         'Transaction Reference': 'int32',
@@ -35,12 +56,74 @@ def read(inpath, **kwargs):
         'Account Created Date',
         'Account Last Refreshed',
     ]
+    if strings:
+        dtypes = collections.defaultdict(lambda: str, dtypes)
 
     return aws.s3read_csv(inpath,
                           sep='|',
                           dtype=dtypes,
                           parse_dates=dates,
-                          infer_datetime_format=True)
+                          infer_datetime_format=True,
+                          **kwargs)
+
+
+def peak_rss():
+    """Return peak resident set size of current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes on Linux
+    unit = 2**20 if sys.platform == 'darwin' else 2**10
+    return peak / unit
+
+
+def rows_per_chunk(inpath, memory_budget, sample_rows=10_000):
+    """Return number of rows per chunk that fit into memory budget.
+
+    Bytes per row are estimated from the first `sample_rows` rows.
+    """
+    sample = read(inpath, nrows=sample_rows)
+    row_bytes = sample.memory_usage(deep=True).sum() / len(sample)
+    chunk_bytes = memory_budget * 2**20 / COPIES_PER_CHUNK
+    return max(1, int(chunk_bytes / row_bytes))
+
+
+def user_chunks(reader):
+    """Yield chunks from reader that end on user boundaries.
+
+    Rows of the last user in each chunk are held back and prepended to the
+    next chunk so that all of a user's transactions end up in the same
+    chunk. Assumes rows are grouped by user, as in the raw extracts.
+    """
+    carry = None
+    for chunk in reader:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        is_last_user = chunk[USER_COL].values == chunk[USER_COL].iat[-1]
+        carry = chunk[is_last_user]
+        if not is_last_user.all():
+            yield chunk[~is_last_user]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def chunk_schema(df):
+    """Return schema to write all chunks with from column types of chunk.
+
+    The schema is built from the dtypes of the columns rather than inferred
+    from their values, so it does not depend on what the first chunk
+    holds: object columns are strings even if all null (e.g. `tag`), and
+    categories are indexed by int32 in case later chunks have more.
+    """
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    fields = []
+    for field in schema:
+        dtype = df[field.name].dtype
+        if dtype == object:
+            field = field.with_type(pa.string())
+        elif isinstance(dtype, pd.CategoricalDtype):
+            field = field.with_type(
+                pa.dictionary(pa.int32(), field.type.value_type))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
 
 
 def pipeline(inpath):
@@ -52,15 +135,49 @@ def pipeline(inpath):
     return df
 
 
+def chunked_pipeline(inpath, outpath, memory_budget):
+    """Run pipeline on chunks of users and write results incrementally.
+
+    Only works if all cleaners are chunk safe (see `decorators.cleaner`).
+    """
+    functions = decorators.cleaner_funcs
+    unsafe = [f.__name__ for f in functions if not f.chunk_safe]
+    if unsafe:
+        raise ValueError(f'Cleaners {unsafe} need the full dataset.')
+
+    chunksize = rows_per_chunk(inpath, memory_budget)
+    writer = None
+    rows = 0
+    with aws.s3open(outpath, 'wb') as sink:
+        try:
+            with read(inpath, strings=True, chunksize=chunksize) as reader:
+                for chunk in user_chunks(reader):
+                    for f in functions:
+                        chunk = f(chunk)
+                    if writer is None:
+                        writer = pq.ParquetWriter(sink, chunk_schema(chunk))
+                    table = pa.Table.from_pandas(chunk, schema=writer.schema,
+                                                 preserve_index=False)
+                    writer.write_table(table)
+                    rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    print(f'{outpath} ({rows:,} rows, chunks of {chunksize:,} rows) written.')
+
+
 def main(args=None):
     if args is None:
         args = sys.argv[1:]
     args = parse_args(args)
-    df = pipeline(args.inpath) 
-    aws.s3write_parquet(df, args.outpath)
-    print(df.head())
+    if args.chunked:
+        chunked_pipeline(args.inpath, args.outpath, args.memory_budget)
+    else:
+        df = pipeline(args.inpath)
+        aws.s3write_parquet(df, args.outpath)
+        print(df.head())
+    print(f'Peak RSS: {peak_rss():,.0f} MB')
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,182 @@
+"""Cache of intermediate results of the cleaning pipeline.
+
+After each step, the data is saved as a feather file keyed by a fingerprint
+of the input file and the source code of all steps up to and including that
+step. Rerunning the pipeline after changing a step thus resumes from the
+last step before it.
+"""
+
+import contextlib
+import glob
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+from .columns import prune
+from .decorators import OrderedCounter, count
+
+
+CACHEDIR = os.path.expanduser('~/.cache/preproc')
+MAX_SIZE = 50 * 2**30
+
+
+def file_fingerprint(path, blocksize=2**20):
+    """Return hash of file contents."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def helpers(func):
+    """Return functions of the module of func that func calls, recursively."""
+    module = inspect.getmodule(func)
+    found, todo = [], [func]
+    while todo:
+        code = getattr(todo.pop(), '__code__', None)
+        for name in code.co_names if code else ():
+            obj = inspect.unwrap(getattr(module, name, None) or func)
+            if (inspect.isfunction(obj) and obj.__module__ == module.__name__
+                    and obj is not func and obj not in found):
+                found.append(obj)
+                todo.append(obj)
+    return found
+
+
+def imported_modules(module):
+    """Return modules of module's package that module imports, recursively.
+
+    Includes modules that names are imported from.
+    """
+    found, todo = set(), [module]
+    while todo:
+        for obj in list(vars(todo.pop()).values()):
+            dep = obj if inspect.ismodule(obj) else inspect.getmodule(obj)
+            if (dep is not None and dep is not module and dep not in found
+                    and dep.__name__.startswith(module.__package__ + '.')):
+                found.add(dep)
+                todo.append(dep)
+    return sorted(found, key=lambda m: m.__name__)
+
+
+def source_of(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        # e.g. modules created at runtime
+        return ''
+
+
+def step_keys(fingerprint, steps):
+    """Return cache key for each step.
+
+    Key of a step depends on the key of the previous step, so changing a
+    step invalidates all later ones. Besides the step, the key covers the
+    helpers it calls from its own module and the modules of the package
+    its module imports (e.g. `strings` and `users`), so editing a helper
+    invalidates the steps using it. For the read step, which calls helpers
+    defined alongside it, the source of the entire module is used.
+    """
+    keys = []
+    key = fingerprint
+    for i, step in enumerate(steps):
+        func = inspect.unwrap(step)
+        module = inspect.getmodule(func)
+        objs = [module] if i == 0 else [func] + helpers(func)
+        source = ''.join(source_of(obj) for obj in objs)
+        for dep in imported_modules(module):
+            source += source_of(dep)
+        key = hashlib.blake2b((key + source).encode(), digest_size=16)
+        key = key.hexdigest()
+        keys.append(key)
+    return keys
+
+
+def load(key):
+    """Return cached data and sample counts for key, or None if missing."""
+    path = os.path.join(CACHEDIR, key)
+    if not os.path.exists(path + '.feather'):
+        return None
+    df = feather.read_table(path + '.feather').to_pandas()
+    with open(path + '.json') as f:
+        counts = OrderedCounter(dict(json.load(f)))
+    # mark as recently used for eviction
+    os.utime(path + '.feather')
+    return df, counts
+
+
+def save(key, df, counts):
+    """Cache data and sample counts for key."""
+    os.makedirs(CACHEDIR, exist_ok=True)
+    path = os.path.join(CACHEDIR, key)
+    table = pa.Table.from_pandas(df)
+    feather.write_feather(table, path + '.feather')
+    with open(path + '.json', 'w') as f:
+        json.dump(list(counts.items()), f)
+
+
+def evict(max_size=MAX_SIZE):
+    """Delete least recently used entries until cache is below max_size."""
+    # workers evict concurrently, so entries may vanish at any point
+    entries = []
+    for fp in glob.glob(os.path.join(CACHEDIR, '*.feather')):
+        with contextlib.suppress(FileNotFoundError):
+            entries.append((os.path.getmtime(fp), os.path.getsize(fp), fp))
+    entries.sort()
+    size = sum(entry[1] for entry in entries)
+    while entries and size > max_size:
+        _, fsize, fp = entries.pop(0)
+        size -= fsize
+        for path in [fp, fp.replace('.feather', '.json')]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def clear():
+    """Delete all cache entries."""
+    shutil.rmtree(CACHEDIR, ignore_errors=True)
+
+
+def run(piece, read, funcs, read_kws=None, drops=None, max_size=MAX_SIZE):
+    """Read and clean piece, resuming from the last cached step.
+
+    Passes `read_kws` to read and drops columns after each step as planned
+    by `columns.plan`, if given. Sample counts added by steps are cached
+    alongside the data so that the selection table is complete when
+    earlier steps are skipped.
+    """
+    steps = [read] + list(funcs)
+    drops = [set()] + (drops or [set()] * len(funcs))
+    read_kws = read_kws or {}
+    # sort sets, whose order varies between processes
+    plan = ({k: sorted(v) if isinstance(v, set) else v
+             for k, v in sorted(read_kws.items())},
+            [sorted(d) for d in drops])
+    fingerprint = file_fingerprint(piece) + repr(plan)
+    keys = step_keys(fingerprint, steps)
+    base = OrderedCounter(count)
+    start, df = 0, piece
+    for i in reversed(range(len(steps))):
+        cached = load(keys[i])
+        if cached is not None:
+            df, counts = cached
+            count.update(counts)
+            start = i + 1
+            break
+    for i, step in enumerate(steps[start:], start):
+        df = step(df, **read_kws) if i == 0 else step(df)
+        if drops[i]:
+            df = prune(df, drops[i])
+        if isinstance(df, pd.DataFrame):
+            counts = OrderedCounter({k: v - base[k] for k, v in count.items()
+                                     if k not in base or v != base[k]})
+            save(keys[i], df, counts)
+    evict(max_size)
+    return df
@@ -1,10 +1,14 @@
 import numpy as np
 import pandas as pd
 from mlbt import config
-from .decorators import cleaner
+from . import strings
+from .decorators import cleaner, per_row
 
 
-@cleaner
+TAGS = ['up_tag', 'auto_tag', 'manual_tag']
+
+
+@cleaner(inputs=['transaction_date'], outputs=['ym'], rowwise=True)
 def add_variables(df):
     """Create helper variables."""
     y = df.transaction_date.dt.year * 100
@@ -13,27 +17,31 @@ def add_variables(df):
     return df
 
 
-@cleaner
+@cleaner(inputs=['transaction_date'])
+@per_row
 def drop_last_month(df):
     """Drop last month, which might have missing data.
     For first month, Jan 2012, we have complete data.
     """
     ym = df.transaction_date.dt.to_period('M')
-    return df[ym < ym.max()]
+    return ym < ym.max()
 
 
-@cleaner
+@cleaner(inputs=['gender'], outputs=['gender'], rowwise=True)
 def clean_gender(df):
     """Categorise 'u' as missing."""
-    df['gender'] = df.gender.str.replace('u', '')
+    df['gender'] = strings.replace(df.gender, 'u', '')
     return df
 
 
-@cleaner
+@cleaner(inputs=TAGS, outputs=TAGS, rowwise=True)
 def clean_tags(df):
     """Replace parenthesis with dash for save regex searches."""
-    for tag in ['up_tag', 'auto_tag', 'manual_tag']:
-        df[tag] = df[tag].str.replace('(', '- ').str.replace(')', '')
+    def replace_parens(tags):
+        return (tags.str.replace('(', '- ', regex=False)
+                .str.replace(')', '', regex=False))
+    for tag in TAGS:
+        df[tag] = strings.on_uniques(df[tag], replace_parens, np.nan)
     return df
 
 
@@ -45,25 +53,91 @@ def drop_business_accounts(df):
     pass
 
 
-@cleaner
+@cleaner(inputs=['manual_tag', 'auto_tag'], outputs=['up_tag'],
+         rowwise=True)
 def correct_up_tag(df):
     """Set up_tag equal to manual_tag if it exists and auto_tag otherwise.
     This is how up_tag is supposed to behave but doesn't always.
     """
     manual_tag_exists = df.manual_tag.values != 'no tag'
-    df['up_tag'] = np.where(manual_tag_exists, df.manual_tag, df.auto_tag)
+    df['up_tag'] = strings.where(manual_tag_exists, df.manual_tag,
+                                 df.auto_tag)
     return df
 
 
-@cleaner
+@cleaner(inputs=[], outputs=['tag'], rowwise=True)
 def add_tag(df):
     """Create empty corrected tag variable."""
     df['tag'] = None
     return df
 
 
-@cleaner
-def tag_pmt_pairs(df, knn=5):
+def match_pairs(group, time, credit, window):
+    """Return mask of txns paired with a txn of opposite sign.
+
+    Txns must be sorted by group and time. Each txn is paired with the
+    earliest unpaired txn of the same group and opposite sign less than
+    `window` earlier. Taking the earliest candidate leaves later ones free
+    for later txns, so this finds a maximum set of non-overlapping pairs.
+
+    Txns of each sign are paired in order, so the k-th credit of a group
+    is paired with its k-th debit. This is done for all groups at once,
+    by rank. Pairs before the first that is `window` or more apart are
+    final. Its earlier txn, and all txns of that sign that are equally
+    far from its later one, are never paired. They are dropped, and the
+    remaining txns of the group are ranked again. Each round thus removes
+    at least one txn per unfinished group.
+    """
+    group, time, credit = map(np.asarray, (group, time, credit))
+    paired = np.zeros(len(group), dtype=bool)
+    todo = np.arange(len(group))
+    while len(todo):
+        g, t, c = group[todo], time[todo], credit[todo]
+        g = np.append(0, np.cumsum(g[1:] != g[:-1]))
+        n_groups = g[-1] + 1
+        first = np.flatnonzero(np.diff(g, prepend=-1))
+        # rank of txns among those of their group and sign
+        credits_before = np.cumsum(c) - c
+        debits_before = np.arange(len(c)) - credits_before
+        before = np.where(c, credits_before, debits_before)
+        rank = before - np.where(c, credits_before[first][g],
+                                 debits_before[first][g])
+        n_debits = np.bincount(g[~c], minlength=n_groups)
+
+        # credits with a debit of the same rank, and that debit
+        credits = np.flatnonzero(c & (rank < n_debits[g]))
+        debits = np.flatnonzero(~c)[debits_before[first][g[credits]]
+                                    + rank[credits]]
+        far = np.abs(t[credits] - t[debits]) >= window
+        # rank of first pair too far apart, or n_debits if none
+        cut = n_debits.copy()
+        np.minimum.at(cut, g[credits[far]], rank[credits[far]])
+        final = rank[credits] < cut[g[credits]]
+        paired[todo[credits[final]]] = True
+        paired[todo[debits[final]]] = True
+
+        # drop earlier txn of first pair too far apart, and the txns of its
+        # sign expired by the later one
+        broken = (rank[credits] == cut[g[credits]]) & far
+        early = np.minimum(credits[broken], debits[broken])
+        late = np.maximum(credits[broken], debits[broken])
+        deadline = np.full(n_groups, np.nan)
+        deadline[g[late]] = t[late] - window
+        sign = np.zeros(n_groups, dtype=bool)
+        sign[g[early]] = c[early]
+        dropped = ((t <= deadline[g]) & (c == sign[g])
+                   & (rank >= cut[g]))
+        broken_groups = np.zeros(n_groups, dtype=bool)
+        broken_groups[g[late]] = True
+        keep = broken_groups[g] & ~dropped & ~paired[todo]
+        todo = todo[keep]
+    return paired
+
+
+@cleaner(inputs=['user_id', 'amount', 'transaction_date',
+                 'credit_debit', 'tag'],
+         outputs=['amount', 'tag'])
+def tag_pmt_pairs(df, max_days=4):
     """Tag payments from one account to another as transfers.
 
     Identification criteria:
@@ -72,61 +146,70 @@ def tag_pmt_pairs(df, knn=5):
     3. same amount
     4. no more than 4 days apart
     5. of the opposite sign (debit/credit)
-    6. not already part of another transfer pair. This can happen in two ways:
-       - A txn forms a pair with two neighbours at different distances,
-         addressed in <1>.
-       - A txn forms a pair with a neighbour and the neighbour with one
-         of its own neighbours, addressed in <2>.
-
-    Code sorts data by user, amount, and transaction date, and checks for each
-    txn and each of its k nearest preceeding neighbours whether, together, they
-    meet the above criteria.
+    6. not already part of another transfer pair.
+
+    Code sorts data by user, amount, and transaction date, and pairs each
+    txn with the earliest unpaired txn that meets the above criteria (see
+    `match_pairs`). Only txns with a txn of opposite sign within the time
+    window on either side can be part of a pair, so only those are checked.
     """
     df['amount'] = df.amount.abs()
     df = df.sort_values(['user_id', 'amount', 'transaction_date'])
-    for k in range(1, knn+1):
-        meets_conds = (
-            (df.user_id.values == df.user_id.shift(k).values)
-            & (df.amount.values > 50)
-            & (df.amount.values == df.amount.shift(k).values)
-            & (df.transaction_date.diff(k).dt.days.values <= 4)
-            & (df.credit_debit.values != df.credit_debit.shift(k).values)
-            & (df.tag.values != 'transfers')                       # <1>
-            & (df.tag.shift(k).values != 'transfers')              # <1>
-        )
-        # tag first txn of pair
-        neighbr_meets_cond = np.roll(meets_conds, k)
-        neighbr_meets_cond[:k] = False
-        is_tfr = meets_conds & ~neighbr_meets_cond                 # <2>
-        df['tag'] = np.where(is_tfr, 'transfers', df.tag)
-        # tag second txn of pair
-        mask = np.roll(meets_conds, -k)
-        mask[-k:] = False
-        df['tag'] = np.where(mask, 'transfers', df.tag)
+    user = df.user_id.to_numpy()
+    amount = df.amount.to_numpy()
+    eligible = np.flatnonzero((amount > 50)
+                              & (df.tag.to_numpy() != 'transfers'))
+    new_group = np.diff(user[eligible], prepend=-1) != 0
+    new_group |= np.diff(amount[eligible], prepend=-1) != 0
+    group = new_group.cumsum()
+    secs = (df.transaction_date.to_numpy('datetime64[s]')[eligible]
+            .astype('int64'))
+    credit = df.credit_debit.eq('credit').to_numpy()[eligible]
+    window = (max_days + 1) * 86_400
+
+    times = pd.DataFrame({
+        'credit': np.where(credit, secs, np.nan),
+        'debit': np.where(credit, np.nan, secs),
+    }).groupby(group)
+    before, after = times.ffill(), times.bfill()
+    prev_opposite = np.where(credit, before.debit, before.credit)
+    next_opposite = np.where(credit, after.debit, after.credit)
+    near = ((secs - prev_opposite < window)
+            | (next_opposite - secs < window))
+
+    candidates = eligible[near]
+    paired = match_pairs(group[near], secs[near], credit[near], window)
+    tag = df.tag.to_numpy(dtype=object, copy=True)
+    tag[candidates[paired]] = 'transfers'
+    df['tag'] = tag
     return df
 
 
-@cleaner
+@cleaner(inputs=['transaction_description', 'tag'], outputs=['tag'],
+         rowwise=True)
 def tag_transfers(df):
     """Tag txns with description indicating tranfser payment."""
     tfr_strings = [' ft', ' trf', 'xfer', 'transfer']
     exclude = ['fee', 'interest']
-    mask = (df.transaction_description.str.contains('|'.join(tfr_strings))
-            & ~df.transaction_description.str.contains('|'.join(exclude)))
+    desc = strings.Uniques(df.transaction_description)
+    mask = (desc.contains('|'.join(tfr_strings))
+            & ~desc.contains('|'.join(exclude)))
     df.loc[mask, 'tag'] = 'transfers'
     return df
 
 
-@cleaner
+@cleaner(inputs=TAGS, rowwise=True)
+@per_row
 def drop_untagged(df):
     """Drop untagged transactions."""
     mask = (df.up_tag.eq('no tag')
             & df.manual_tag.eq('no tag')
             & df.auto_tag.eq('no tag'))
-    return df[~mask]
+    return ~mask
 
 
-@cleaner
+@cleaner(inputs=[config.TAGVAR, 'credit_debit', 'tag'], outputs=['tag'],
+         rowwise=True)
 def tag_incomes(df):
     """Tag earnings, pensions, benefits, and other income.
     Based on Appendix A in Haciouglu et al. (2020).
@@ -165,52 +248,57 @@ def tag_incomes(df):
             'student loan funds',
         ],
     }
+    tagvar = strings.Uniques(df[config.TAGVAR])
+    credit = df.credit_debit.eq('credit')
     for type, tags in incomes.items():
-        tagvar = config.TAGVAR
         pattern = '|'.join(tags)
-        mask = df[tagvar].str.match(pattern) & df.credit_debit.eq('credit')
+        mask = tagvar.match(pattern) & credit
         df.loc[mask, 'tag'] = type + '_income'
     return df
 
 
-@cleaner
+@cleaner(inputs=[config.TAGVAR, 'tag'], outputs=['tag'], rowwise=True)
 def tag_corrections(df):
     """Correct or consolidate tag variable."""
     new_tags = {
         'housing': ['rent', 'mortgage or rent', 'mortgage payment']
     }
+    tagvar = strings.Uniques(df[config.TAGVAR])
     for new_tag, old_tags in new_tags.items():
         pattern = '|'.join(old_tags)
-        mask = df[config.TAGVAR].str.match(pattern)
+        mask = tagvar.match(pattern)
         df.loc[mask, 'tag'] = new_tag
     return df
 
 
-@cleaner
+@cleaner(inputs=['tag', 'up_tag'], outputs=['tag'], rowwise=True)
 def fill_tag(df):
     """Replace tag with up_tag if missing ."""
-    df['tag'] = np.where(df.tag.isna(), df.up_tag, df.tag)
+    df['tag'] = strings.where(df.tag.isna(), df.up_tag, df.tag)
     return df
 
 
-@cleaner
+@cleaner(inputs=['auto_tag', 'account_type'], rowwise=True)
+@per_row
 def drop_card_repayments(df):
     """Drop card repayment transactions from current accounts."""
     tags = ['credit card repayment', 'credit card payment', 'credit card']
     pattern = '|'.join(tags)
-    mask = df.auto_tag.str.contains(pattern) & df.account_type.eq('current')
-    return df[~mask]
+    mask = (strings.contains(df.auto_tag, pattern)
+            & df.account_type.eq('current'))
+    return ~mask
 
 
-@cleaner
+@cleaner(inputs=['credit_debit', 'amount'], outputs=['amount'],
+         rowwise=True)
 def sign_amount(df):
     """Make credits negative."""
-    credit = df.credit_debit.values == 'credit'
+    credit = df.credit_debit.eq('credit').to_numpy()
     df['amount'] = np.where(credit, df.amount.mul(-1), df.amount)
     return df
 
 
-@cleaner
+@cleaner(inputs=[])
 def str_to_cat(df):
     """Convert string columns to categoricals for efficient storage."""
     strs = df.select_dtypes('object')
@@ -218,7 +306,8 @@ def str_to_cat(df):
     return df
 
 
-@cleaner
+@cleaner(inputs=['salary_range'], outputs=['salary_range'],
+         rowwise=True)
 def order_salaries(df):
     """Turn salary range into ordered variable."""
     cats = ['< 10k', '10k to 20k', '20k to 30k',
@@ -229,26 +318,27 @@ def order_salaries(df):
     return df
 
 
-@cleaner
+@cleaner(inputs=[], drops=['auto_tag', 'manual_tag'], rowwise=True)
 def drop_unneeded_vars(df):
     """Drop unneeded variables."""
     # vars = ['auto_tag', 'manual_tag', 'up_tag']
     vars = ['auto_tag', 'manual_tag']
 
-    return df.drop(columns=vars)
+    return df.drop(columns=vars, errors='ignore')
 
 
-@cleaner
+@cleaner(inputs=[], rowwise=True)
 def order_columns(df):
     first = [
         'user_id', 'transaction_date', 'amount',
         'transaction_description', 'merchant_name', 'tag',
     ]
+    first = [col for col in first if col in df]
     rest = set(df.columns) - set(first)
     ordered = first + list(rest)
     return df[ordered]
 
 
-@cleaner
+@cleaner(inputs=['user_id', 'transaction_date'])
 def sort_rows(df):
     return df.sort_values(['user_id', 'transaction_date'], ignore_index=True)
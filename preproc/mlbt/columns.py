@@ -0,0 +1,80 @@
+"""Column pruning based on the column dependencies of registered steps.
+
+Cleaners and selectors declare which columns they read, create, and drop
+when they are registered (see `decorators.register`). From this, `plan`
+derives which raw columns need to be read at all and after which step each
+column is no longer needed.
+"""
+
+import pandas as pd
+
+
+def final_columns(columns, steps):
+    """Return columns left after running all steps without pruning."""
+    live = set(columns)
+    for step in steps:
+        live = (live | step.outputs) - step.drops
+    return live
+
+
+def plan(columns, steps, keep=None):
+    """Return columns to read and columns to drop after each step.
+
+    `columns` are the available raw columns and `keep` the columns wanted in
+    the final data, by default all columns that are not dropped by a step.
+    Steps that don't declare their inputs are assumed to read all columns
+    available to them.
+    """
+    if keep is None:
+        keep = final_columns(columns, steps)
+    keep = set(keep)
+
+    last_use = {}
+    available = set(columns)
+    for i, step in enumerate(steps):
+        inputs = available if step.inputs is None else step.inputs
+        last_use.update(dict.fromkeys(inputs, i))
+        available = (available | step.outputs) - step.drops
+
+    to_read = {col for col in columns if col in keep or col in last_use}
+    drops = [set() for _ in steps]
+    for col, i in last_use.items():
+        if col not in keep:
+            drops[i].add(col)
+    for i, step in enumerate(steps):
+        for col in step.outputs - keep:
+            if last_use.get(col, -1) < i:
+                drops[i].add(col)
+    return to_read, drops
+
+
+def prune(df, cols):
+    """Drop columns from df if they exist."""
+    cols = [col for col in cols if col in df]
+    return df.drop(columns=cols) if cols else df
+
+
+def live_columns(to_read, steps, drops):
+    """Return table of live columns after each step."""
+    rows = []
+    live = set(to_read)
+    rows.append(('read', sorted(live)))
+    for step, dropped in zip(steps, drops):
+        live = (live | step.outputs) - step.drops - dropped
+        rows.append((step.__name__, sorted(live)))
+    return pd.DataFrame(rows, columns=['step', 'columns'])
+
+
+def memory_estimate(table, row_bytes, n_rows, default_bytes=8):
+    """Add estimated memory in MB of live columns to table.
+
+    Bytes per row are taken from `row_bytes` (e.g. measured on a sample of
+    the raw data) or `default_bytes` for columns created by steps. Rows
+    dropped by steps are ignored, so this is an upper bound.
+    """
+    def mb(cols):
+        return sum(row_bytes.get(col, default_bytes) for col in cols)
+
+    table['n_cols'] = table['columns'].map(len)
+    table['est_mb'] = table['columns'].map(mb) * n_rows / 2**20
+    return table
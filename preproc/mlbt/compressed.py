@@ -0,0 +1,276 @@
+"""Parallel decompression of block-compressed raw extracts.
+
+Block-compressed files consist of independently compressed blocks whose
+positions can be found without decompressing them: BGZF files (multi-member
+gzip files whose member headers hold the member size, as written by
+`bgzip`) and seekable zstd files (zstd frames followed by a seek table, as
+written by `zstd --seekable` tools). Blocks are decompressed in parallel
+threads, as zlib and zstandard release the GIL. Other gzip and zstd files
+are read as a single block, i.e. decompressed serially. Finding the blocks
+of a BGZF file reads the whole file unless it has a `.gzi` index (as
+written by `bgzip -i`).
+
+`zstandard` is only needed for zstd files.
+"""
+
+import collections
+import contextlib
+import io
+import os
+import struct
+import zlib
+from concurrent import futures
+
+import numpy as np
+
+import aws
+
+
+SUFFIXES = ('.gz', '.zst', '.zstd')
+
+# compressed bytes decompressed at a time by each thread
+CHUNK_SIZE = 16 * 2**20
+
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+
+
+def is_compressed(path):
+    return isinstance(path, str) and path.endswith(SUFFIXES)
+
+
+def is_gzip(path):
+    return path.endswith('.gz')
+
+
+def gzi_blocks(path, size):
+    """Return offsets and sizes of BGZF blocks from `.gzi` index, or None.
+
+    The index lists the compressed and uncompressed offset of each block
+    but the first.
+    """
+    try:
+        with aws.s3open(path + '.gzi', 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    n, = struct.unpack_from('<Q', data)
+    offsets = np.frombuffer(data, '<u8', 2 * n, 8)[::2].astype('int64')
+    offsets = np.concatenate([[0], offsets])
+    sizes = np.diff(offsets, append=size)
+    return list(zip(offsets.tolist(), sizes.tolist()))
+
+
+def bgzf_blocks(f, size):
+    """Return offsets and sizes of BGZF blocks, or None if not BGZF.
+
+    Headers are parsed from buffers of `CHUNK_SIZE` bytes rather than read
+    block by block.
+    """
+    blocks = []
+    offset = 0
+    buffer, start = b'', 0
+    while offset < size:
+        pos = offset - start
+        if pos + 12 > len(buffer):
+            f.seek(offset)
+            buffer, start, pos = f.read(CHUNK_SIZE), offset, 0
+        if buffer[pos:pos + 4] != b'\x1f\x8b\x08\x04':
+            return None
+        xlen, = struct.unpack_from('<H', buffer, pos + 10)
+        if pos + 12 + xlen > len(buffer):
+            f.seek(offset)
+            buffer, start, pos = f.read(CHUNK_SIZE), offset, 0
+        extra = buffer[pos + 12:pos + 12 + xlen]
+        block_size = None
+        pos = 0
+        while pos + 4 <= xlen:
+            sub_id, sub_len = extra[pos:pos + 2], extra[pos + 2:pos + 4]
+            sub_len, = struct.unpack('<H', sub_len)
+            if sub_id == b'BC' and sub_len == 2:
+                block_size = struct.unpack(
+                    '<H', extra[pos + 4:pos + 6])[0] + 1
+            pos += 4 + sub_len
+        if block_size is None:
+            return None
+        blocks.append((offset, block_size))
+        offset += block_size
+    return blocks
+
+
+def zstd_blocks(f, size):
+    """Return offsets and sizes of frames of seekable zstd file, or None."""
+    if size < 9:
+        return None
+    f.seek(size - 9)
+    n_frames, descriptor, magic = struct.unpack('<IBI', f.read(9))
+    if magic != ZSTD_SEEKABLE_MAGIC:
+        return None
+    entry_size = 12 if descriptor & 0x80 else 8
+    f.seek(size - 9 - n_frames * entry_size)
+    table = f.read(n_frames * entry_size)
+    sizes = [struct.unpack_from('<I', table, i * entry_size)[0]
+             for i in range(n_frames)]
+    offsets = np.cumsum([0] + sizes[:-1])
+    return [(int(offset), size) for offset, size in zip(offsets, sizes)]
+
+
+def blocks(path):
+    """Return offsets and sizes of independently compressed blocks."""
+    size = aws.info(path)['size']
+    found = gzi_blocks(path, size) if is_gzip(path) else None
+    if found is None:
+        find = bgzf_blocks if is_gzip(path) else zstd_blocks
+        with aws.s3open(path, 'rb') as f:
+            found = find(f, size)
+    return found or [(0, size)]
+
+
+def gunzip(data):
+    """Return decompressed data of one or more gzip members."""
+    out = []
+    while data:
+        d = zlib.decompressobj(31)
+        out.append(d.decompress(data))
+        data = d.unused_data
+    return b''.join(out)
+
+
+def decompress(path, data, span):
+    """Return decompressed data of consecutive whole blocks in span."""
+    if is_gzip(path):
+        view = memoryview(data)
+        start = span[0][0]
+        return b''.join(gunzip(view[offset - start:offset - start + size])
+                        for offset, size in span)
+    import zstandard
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        io.BytesIO(data), read_across_frames=True)
+    return reader.read()
+
+
+def read_blocks(path, span, f=None):
+    """Return decompressed data of consecutive blocks in span."""
+    if not span:
+        return b''
+    start = span[0][0]
+    end = span[-1][0] + span[-1][1]
+    if f is None:
+        opened = aws.s3open(path, 'rb')
+    else:
+        opened = contextlib.nullcontext(f)
+    with opened as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return decompress(path, data, span)
+
+
+def chunks(path, max_workers=None):
+    """Yield decompressed data of file in order.
+
+    Blocks are decompressed in parallel in spans of about `CHUNK_SIZE`
+    compressed bytes, with at most two spans per thread decompressed
+    ahead of the one yielded. Uses one thread per core by default.
+    """
+    max_workers = max_workers or os.cpu_count()
+    spans, span, span_size = [], [], 0
+    for block in blocks(path):
+        span.append(block)
+        span_size += block[1]
+        if span_size >= CHUNK_SIZE:
+            spans.append(span)
+            span, span_size = [], 0
+    if span:
+        spans.append(span)
+    with futures.ThreadPoolExecutor(max_workers) as pool:
+        ahead = 2 * max_workers
+        todo = collections.deque()
+        try:
+            for span in spans:
+                todo.append(pool.submit(read_blocks, path, span))
+                if len(todo) > ahead:
+                    yield todo.popleft().result()
+            while todo:
+                yield todo.popleft().result()
+        finally:
+            # closed before the end, e.g. after reading nrows
+            for future in todo:
+                future.cancel()
+
+
+class ChunkReader(io.RawIOBase):
+    """Binary file object reading from an iterable of bytes."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = memoryview(b'')
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # stop decompressing ahead and shut down threads
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        super().close()
+
+    def readinto(self, b):
+        while self.pos == len(self.chunk):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.chunk, self.pos = memoryview(chunk), 0
+        n = min(len(b), len(self.chunk) - self.pos)
+        b[:n] = self.chunk[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+def open_parallel(path, mode='rt', max_workers=None):
+    """Open compressed file for reading, decompressing blocks in parallel."""
+    f = io.BufferedReader(ChunkReader(chunks(path, max_workers)),
+                          buffer_size=2**20)
+    return f if mode == 'rb' else io.TextIOWrapper(f)
+
+
+def block_ranges(path, n_ranges):
+    """Split file into about n_ranges ranges of whole blocks.
+
+    Returns blocks and start and end index of each range, to be read with
+    `read_block_range`.
+    """
+    found = blocks(path)
+    ends = np.cumsum([size for _, size in found])
+    targets = np.linspace(0, ends[-1], n_ranges + 1)[1:-1]
+    bounds = np.unique([0, *np.searchsorted(ends, targets, 'right'),
+                        len(found)])
+    return [(found, i, j) for i, j in zip(bounds[:-1], bounds[1:])]
+
+
+def read_block_range(path, found, i, j):
+    """Return header and all lines that start in blocks i to j.
+
+    Like `read_raw.read_byte_range` for positions in the decompressed data:
+    the last byte of the previous block tells whether the first line in
+    the range starts in it, and the last line is completed from the
+    following blocks.
+    """
+    with aws.s3open(path, 'rb') as f:
+        header = b''
+        for k in range(len(found)):
+            header += read_blocks(path, found[k:k + 1], f)
+            if b'\n' in header:
+                break
+        header = header[:header.find(b'\n') + 1]
+        lead = read_blocks(path, found[i - 1:i], f)[-1:] if i else b''
+        data = lead + read_blocks(path, found[i:j], f)
+        # skip remainder of line that starts in previous range (or header)
+        nl = data.find(b'\n')
+        data = data[nl + 1:] if nl >= 0 else b''
+        k = j
+        while data and not data.endswith(b'\n') and k < len(found):
+            more = read_blocks(path, found[k:k + 1], f)
+            nl = more.find(b'\n')
+            data += more if nl < 0 else more[:nl + 1]
+            k += 1
+    return header + data
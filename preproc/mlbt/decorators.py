@@ -2,6 +2,8 @@ from collections import Counter, OrderedDict
 from functools import wraps
 import re
 
+import pandas as pd
+
 
 class OrderedCounter(Counter, OrderedDict):
     """Counter that stores elements in the order they are added."""
@@ -15,20 +17,69 @@ class OrderedCounter(Counter, OrderedDict):
 
 count = OrderedCounter()
 
+# bytes copied by filtering rows, by step
+copied = OrderedCounter()
+
 cleaner_funcs = []
 selector_funcs = []
 
 
-def cleaner(func):
-    """Add function to list of cleaner functions."""
-    cleaner_funcs.append(func)
+def register(funcs, func, inputs, outputs, drops, rowwise):
+    """Add function to list and attach its column dependencies.
+
+    `inputs` are the columns the function reads, `outputs` the ones it
+    creates or changes, and `drops` the ones it removes. Inputs of None
+    mean the function might read any column. Inputs already attached to
+    func (e.g. by `counter`) are kept. `rowwise` marks functions whose
+    result for a row depends only on that row, so that they can run on
+    rows yet to be filtered out (see `deferred`).
+    """
+    if inputs is not None:
+        inputs = set(inputs) | getattr(func, 'inputs', set())
+    func.inputs = inputs
+    func.outputs = set(outputs)
+    func.drops = set(drops)
+    func.rowwise = rowwise
+    funcs.append(func)
     return func
 
 
-def selector(func):
+def cleaner(func=None, *, inputs=None, outputs=(), drops=(), rowwise=False):
     """Add function to list of cleaner functions."""
-    selector_funcs.append(func)
-    return func
+    if func is None:
+        return lambda func: register(cleaner_funcs, func,
+                                     inputs, outputs, drops, rowwise)
+    return register(cleaner_funcs, func, inputs, outputs, drops, rowwise)
+
+
+def selector(func=None, *, inputs=None, outputs=(), drops=(),
+             rowwise=False):
+    """Add function to list of cleaner functions."""
+    if func is None:
+        return lambda func: register(selector_funcs, func,
+                                     inputs, outputs, drops, rowwise)
+    return register(selector_funcs, func, inputs, outputs, drops, rowwise)
+
+
+def take(df, rows, step, drops=()):
+    """Return rows of df without columns in drops and record bytes copied."""
+    if drops:
+        df = df.loc[rows, [col for col in df if col not in drops]]
+    else:
+        df = df[rows]
+    copied[step] += int(df.memory_usage(deep=False).sum())
+    return df
+
+
+def add_count(func, users, accs, txns, value):
+    """Add sample counts after selection function to count."""
+    docstr = re.match('[^\n]*', func.__doc__).group()[:-1]
+    count.update({
+        docstr + '@users': users,
+        docstr + '@accs': accs,
+        docstr + '@txns': txns,
+        docstr + '@value': value / 1e6
+    })
 
 
 def counter(func):
@@ -38,12 +89,37 @@ def counter(func):
     @ wraps(func)
     def wrapper(*args, **kwargs):
         df = func(*args, **kwargs)
-        docstr = re.match('[^\n]*', func.__doc__).group()[:-1]
-        count.update({
-            docstr + '@users': df.user_id.nunique(),
-            docstr + '@accs': df.account_id.nunique(),
-            docstr + '@txns': len(df),
-            docstr + '@value': df.amount.abs().sum() / 1e6
-        })
+        add_count(func, df.user_id.nunique(), df.account_id.nunique(),
+                  len(df), df.amount.abs().sum())
         return df
+    wrapper.inputs = {'user_id', 'account_id', 'amount'}
+    wrapper.counted = True
+    return wrapper
+
+
+def per_user(*features):
+    """Make selector that keeps users based on per-user features.
+
+    The decorated function takes a table of users with the columns returned
+    by `features` (see `users`) and returns a boolean Series of users to
+    keep. The resulting selector returns the txns of these users.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(df, *args, **kwargs):
+            table = pd.concat([f(df) for f in features], axis=1)
+            keep = func(table, *args, **kwargs)
+            return take(df, df.user_id.isin(keep[keep].index), func.__name__)
+        wrapper.features = features
+        wrapper.criterion = func
+        return wrapper
+    return decorator
+
+
+def per_row(func):
+    """Make step that keeps txns for which func returns True."""
+    @wraps(func)
+    def wrapper(df, *args, **kwargs):
+        return take(df, func(df, *args, **kwargs), func.__name__)
+    wrapper.mask = func
     return wrapper
@@ -0,0 +1,91 @@
+"""Run cleaning steps with deferred row filters.
+
+Row-level steps (see `decorators.per_row`) return a mask of rows to keep.
+In lazy mode, `run` combines these masks instead of filtering the data
+after each of them, and only filters it before a step that needs the
+filtered data, i.e. one not declared `rowwise`, and at the end. Steps
+declared `rowwise` run on all rows, including those to be filtered out.
+
+In fused mode, user-level selectors (see `decorators.per_user`) are
+deferred too: the features of all of them are computed once, their
+criteria applied in turn to the table of users, and sample counts derived
+from per-user totals.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .columns import prune
+from .decorators import add_count, take
+
+
+def totals(df):
+    """Return number and value of txns per user and user-account pairs."""
+    g = df.amount.abs().groupby(df.user_id)
+    table = pd.DataFrame({'txns': g.size(), 'value': g.sum()})
+    pairs = (df.groupby(['user_id', 'account_id'], sort=False).size()
+             .index.to_frame(index=False))
+    return table, pairs
+
+
+def run(df, funcs, drops=None, fused=False, lazy=True):
+    """Run funcs on df, filtering rows only when needed.
+
+    Columns are dropped as planned by `columns.plan` whenever rows are
+    filtered. Bytes copied to filter rows are attributed to the step that
+    needs the filtered data, or to 'end'. Summed values in the sample
+    counts of fused selectors may differ from those of running them one by
+    one by float rounding.
+    """
+    if drops is None:
+        drops = [set()] * len(funcs)
+    rows = np.ones(len(df), dtype=bool)
+    keep = None
+    dropped = set()
+    for i, (func, cols) in enumerate(zip(funcs, drops)):
+        fuse = fused and hasattr(func, 'criterion')
+        if keep is not None and not fuse:
+            rows &= df.user_id.isin(keep[keep].index).to_numpy()
+            keep = None
+        if not (fuse or lazy and func.rowwise):
+            if not rows.all():
+                df = take(df, rows, func.__name__, dropped)
+                rows = np.ones(len(df), dtype=bool)
+            else:
+                df = prune(df, dropped)
+            dropped = set()
+        if fuse:
+            if keep is None:
+                data = df if rows.all() else take(df, rows, func.__name__)
+                features = dict.fromkeys(f for step in funcs[i:]
+                                         for f in getattr(step, 'features', ()))
+                table, pairs = totals(data)
+                table = table.join(pd.concat([f(data) for f in features],
+                                             axis=1))
+                keep = pd.Series(True, index=table.index)
+            keep &= func.criterion(table)
+            kept = table[keep]
+            accs = pairs.account_id[pairs.user_id.isin(kept.index)]
+            add_count(func, len(kept), accs.nunique(), int(kept.txns.sum()),
+                      kept.value.sum())
+        elif hasattr(func, 'mask'):
+            rows &= func.mask(df).to_numpy()
+            if getattr(func, 'counted', False):
+                data = df.loc[rows, ['user_id', 'account_id', 'amount']]
+                add_count(func, data.user_id.nunique(),
+                          data.account_id.nunique(), len(data),
+                          data.amount.abs().sum())
+        else:
+            df = func(df)
+            # steps that are not rowwise may filter rows themselves
+            if not func.rowwise and isinstance(df, pd.DataFrame):
+                rows = np.ones(len(df), dtype=bool)
+        dropped |= cols
+    if isinstance(df, pd.DataFrame):
+        if keep is not None:
+            rows &= df.user_id.isin(keep[keep].index).to_numpy()
+        if not rows.all():
+            df = take(df, rows, 'end', dropped)
+        else:
+            df = prune(df, dropped)
+    return df
@@ -0,0 +1,104 @@
+"""Executors running pipeline work on pieces.
+
+All backends are `concurrent.futures` executors whose futures are
+`concurrent.futures.Future`s, so pieces are submitted and collected the
+same way whatever runs them:
+
+- 'local' runs each call in the calling process, for debugging with
+  breakpoints and profilers.
+- 'process' runs calls in a pool of processes on this machine.
+- 'dask' runs calls on a Dask distributed cluster.
+- 'ray' runs calls as tasks on a Ray cluster.
+
+The cluster backends connect to the scheduler (Dask) or head node (Ray) at
+`address`, or else start a local cluster of `max_workers` processes, which
+runs the multi-node code path on one machine. Workers on other nodes need
+to be able to read the paths passed to them: when ingesting, the raw file
+and parts of pieces, which workers write to a shared directory (e.g. on
+S3; see `make_data.parts_dir`), and otherwise pieces split to a shared
+filesystem (set `TMPDIR`). Cleaned pieces are returned to and merged in
+the calling process on all backends, so it must hold the cleaned data.
+
+`dask.distributed` and `ray` are only needed for their backends.
+"""
+
+import contextlib
+import os
+from concurrent import futures
+
+
+BACKENDS = ('local', 'process', 'dask', 'ray')
+
+
+class InProcessExecutor(futures.Executor):
+    """Executor running each call when it is submitted."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@contextlib.contextmanager
+def dask_executor(max_workers=None, address=None):
+    """Yield executor of Dask cluster at address or of a local cluster."""
+    from dask import distributed
+    if address is None:
+        cluster = distributed.LocalCluster(
+            n_workers=max_workers or os.cpu_count(), threads_per_worker=1,
+            dashboard_address=None)
+    else:
+        cluster = contextlib.nullcontext(address)
+    with cluster as cluster:
+        with distributed.Client(cluster) as client:
+            # calls read files and update counts, so never reuse results
+            with client.get_executor(pure=False) as pool:
+                yield pool
+
+
+class RayExecutor(futures.Executor):
+    """Executor running calls as tasks on Ray cluster at address.
+
+    Starts a local cluster of max_workers CPUs if address is None.
+    """
+
+    def __init__(self, max_workers=None, address=None):
+        import ray
+        self.ray = ray
+        ray.init(address=address,
+                 num_cpus=max_workers if address is None else None)
+        self.remotes = {}
+
+    def submit(self, fn, /, *args, **kwargs):
+        if fn not in self.remotes:
+            self.remotes[fn] = self.ray.remote(fn)
+        return self.remotes[fn].remote(*args, **kwargs).future()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.ray.shutdown()
+
+
+def executor(backend='process', max_workers=None, address=None):
+    """Return executor of backend, to be used as a context manager.
+
+    See module docstring for backends. address is only used by cluster
+    backends.
+    """
+    if backend == 'local':
+        return InProcessExecutor()
+    if backend == 'process':
+        return futures.ProcessPoolExecutor(max_workers)
+    if backend == 'dask':
+        return dask_executor(max_workers, address)
+    if backend == 'ray':
+        return RayExecutor(max_workers, address)
+    raise ValueError(f'Unknown backend {backend!r}, expected one of '
+                     f'{BACKENDS}.')
+
+
+def is_local(backend, address=None):
+    """Return whether workers of backend run on this machine."""
+    return backend in ('local', 'process') or address is None
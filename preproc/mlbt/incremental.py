@@ -0,0 +1,149 @@
+"""Incremental processing of monthly extracts.
+
+Extracts grow by a month at a time. Instead of cleaning the full history
+on every refresh, `make_data.update_data` cleans only txns from the
+watermark, the last complete month already processed, plus an overlap
+window needed by `tag_pmt_pairs`, and writes these months to the panel.
+The watermark month itself is cleaned again and replaced: its last txns
+can pair with txns of the next month, which `drop_last_month` removed
+when it was last processed. Earlier months only pair with txns that were
+in the extract when they were processed, so they match a full run, up to
+pairs that depend on txns before the overlap through chains of txns less
+than the pairing window apart.
+
+The panel holds the cleaned txns of all users, as a user that failed a
+selector so far may pass it once more months are observed. Users are
+selected on per-user features computed from a small state of monthly
+summaries per user, which is updated with the new months and from which
+the features of `users` can be derived exactly.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import strings, users
+from .decorators import selector_funcs
+
+
+# days before the first new month that are cleaned again so that
+# `tag_pmt_pairs` sees txns paired with the first new txns
+OVERLAP_DAYS = 5
+
+
+def load_watermark(path):
+    """Return last complete month processed (as yyyymm), or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['ym']
+
+
+def save_watermark(path, ym):
+    with open(path, 'w') as f:
+        json.dump({'ym': int(ym)}, f)
+
+
+def previous_month(ym):
+    """Return month before ym (as yyyymm)."""
+    return ym - 1 if ym % 100 > 1 else ym - 100 + 11
+
+
+def window_start(ym):
+    """Return first date to clean when months up to ym are processed."""
+    next_month = pd.Period(year=ym // 100, month=ym % 100, freq='M') + 1
+    return next_month.start_time - pd.Timedelta(days=OVERLAP_DAYS)
+
+
+def summarise(df):
+    """Return state of monthly summaries per user of cleaned txns."""
+    debits = df.amount.where(df.amount > 0)
+    is_income = strings.contains(df.tag, '_income').to_numpy()
+    data = pd.DataFrame({
+        'user_id': df.user_id,
+        'ym': df.ym,
+        'account_id': df.account_id,
+        'current': df.account_type.eq('current'),
+        'debits': debits.astype('float64'),
+        'income': df.amount.where(is_income).astype('float64'),
+        'year_of_birth': df.year_of_birth,
+    })
+    g = data.groupby(['user_id', 'ym'])
+    return pd.DataFrame({
+        'current': g.current.any(),
+        'debits': g.debits.sum(),
+        'n_debits': g.debits.count(),
+        'income': g.income.sum(),
+        'n_income': g.income.count(),
+        'n_accounts': g.account_id.nunique(),
+        'year_of_birth': g.year_of_birth.first(),
+    }).reset_index()
+
+
+def update(state, df, watermark=None):
+    """Return state with summaries of months of df after watermark.
+
+    Summaries of those months already in state, left by an interrupted
+    update, are replaced.
+    """
+    if state is not None and watermark is not None:
+        state = state[state.ym <= watermark]
+    return pd.concat([state, summarise(df)], ignore_index=True)
+
+
+def features(state):
+    """Return table of per-user features from state.
+
+    Matches the features of `users` computed on all txns of the users.
+    """
+    g = state.groupby('user_id')
+    index = pd.Index(g.size().index, name='user_id')
+    table = pd.DataFrame({
+        'months': g.size(),
+        'current_account': g.current.any(),
+        'year_of_birth': g.year_of_birth.last(),
+    })
+
+    # ignore first and last month with debits of each user
+    debits = state[state.n_debits > 0]
+    ym = debits.groupby('user_id').ym
+    inner = debits[(debits.ym > ym.transform('min'))
+                   & (debits.ym < ym.transform('max'))]
+    g = inner.groupby('user_id')
+    table['min_spend'] = g.debits.min()
+    table['min_debits'] = g.n_debits.min()
+
+    income = state[state.n_income > 0]
+    table['income_months'] = (income.groupby('user_id').size()
+                              .reindex(index, fill_value=0))
+    first_month = state.groupby('user_id').ym.transform('min') % 100
+    first_month = first_month[state.n_income > 0]
+    data = pd.DataFrame({
+        'user_id': income.user_id,
+        'year': income.ym // 100 - (income.ym % 100 < first_month),
+        'amount': income.income,
+    })
+    table = table.join(users.income_range(data))
+
+    g = state.groupby('user_id')
+    table['max_accounts'] = g.n_accounts.max()
+    table['max_debits'] = debits.groupby('user_id').debits.max()
+    return table
+
+
+def select(state):
+    """Return ids of users that pass all selectors.
+
+    User-level selectors are applied to the features of each user and
+    row-level ones to user attributes such as year of birth.
+    """
+    table = features(state)
+    keep = pd.Series(True, index=table.index)
+    for func in selector_funcs:
+        if hasattr(func, 'criterion'):
+            keep &= func.criterion(table)
+        elif hasattr(func, 'mask'):
+            keep &= func.mask(table)
+    return table.index[keep.to_numpy(dtype=bool)].to_numpy(np.int64)
@@ -2,32 +2,53 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import collections
 import contextlib
 import cProfile
+import io
+import itertools
+import math
 import os
 import pstats
 import re
-import smart_open
 import sys
-import s3fs
 import tempfile
 import time
+import uuid
 
 from concurrent import futures
 from functools import wraps
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from memory_profiler import profile
 
+import aws
+
 from src import config
 from . import (
+    cache,
+    compressed,
+    deferred,
+    executors,
+    incremental,
+    optimise,
     selection_table,
     save_selection_table,
+    vocab,
     OrderedCounter,
+    copied,
+    count,
     cleaner_funcs,
     selector_funcs,
     read_raw
 )
+from .columns import live_columns, memory_estimate, plan, prune
+from .read_raw import ARROW_SUFFIX, read_arrow, read_byte_range, write_arrow
+
+
+# shared memory file system for results of workers, if available
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
 
 
 def timer(func):
@@ -46,59 +67,593 @@ def timer(func):
     return wrapper
 
 
+def file_size(filepath):
+    """Return size of local or s3 file in bytes."""
+    return aws.info(filepath)['size']
+
+
+def number_of_pieces(filepath, piece_size=None):
+    """Return number of pieces to split file into.
+
+    One piece per core by default, or as many as needed for pieces of
+    roughly `piece_size` MB.
+    """
+    if piece_size is None:
+        return os.cpu_count()
+    return max(1, math.ceil(file_size(filepath) / (piece_size * 2**20)))
+
+
+def ranges(filepath, n_ranges):
+    """Split file into ranges to be read in parallel by `read_range`.
+
+    Byte ranges of plain files, and ranges of whole blocks of compressed
+    ones (see `compressed`). Planned on the current size of the file, even
+    if it was replaced since its info was cached.
+    """
+    aws.invalidate(filepath)
+    if compressed.is_compressed(filepath):
+        return compressed.block_ranges(filepath, n_ranges)
+    return byte_ranges(filepath, n_ranges)
+
+
+def byte_ranges(filepath, n_ranges):
+    """Split data part of file (after the header) into byte ranges."""
+    with aws.s3open(filepath, 'rb') as f:
+        start = len(f.readline())
+    size = file_size(filepath)
+    bounds = np.linspace(start, size, n_ranges + 1).astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def piece_of(user_id, n_pieces):
+    """Return piece number for user id (or array of user ids).
+
+    Uses Knuth's multiplicative hash so that pieces are balanced even if
+    user ids are not uniformly distributed modulo the number of pieces.
+    """
+    return (user_id * 2654435761 % 2**32) * n_pieces >> 32
+
+
+def piece_balance(pieces):
+    """Print size of largest and smallest piece relative to average."""
+    sizes = [os.path.getsize(piece) for piece in pieces]
+    mean = sum(sizes) / len(sizes)
+    print(f'{len(sizes)} pieces of {mean / 2**20:,.1f} MB on average, '
+          f'largest {max(sizes) / mean:.2f}x, '
+          f'smallest {min(sizes) / mean:.2f}x of average.')
+
+
 @timer
-def split_file(filepath, dir):
-    """Split file into pieces based on first digit of user id."""
-    with smart_open.open(filepath, 'rt') as source:
+def split_file(filepath, dir, n_pieces=None):
+    """Split file into pieces based on hash of user id.
+
+    All transactions of a user end up in the same piece. Number of pieces
+    defaults to one per core. Block-compressed files are decompressed in
+    parallel (see `compressed`).
+    """
+    if n_pieces is None:
+        n_pieces = number_of_pieces(filepath)
+    if compressed.is_compressed(filepath):
+        source = compressed.open_parallel(filepath)
+    else:
+        source = aws.s3open(filepath, 'rt')
+    with source:
         with contextlib.ExitStack() as stack:
-            targets = {}
-            for n in range(1, 10):
+            targets = []
+            for n in range(n_pieces):
                 fp = os.path.join(dir, f'{n}.csv')
-                targets[str(n)] = stack.enter_context(open(fp, 'a'))
+                targets.append(stack.enter_context(open(fp, 'w')))
             header = source.readline()
-            for f in targets.values():
+            for f in targets:
                 f.write(header)
             RE = re.compile('^"(?P<txn_id>\d+)"\|"(?P<user_id>\d+)"')
             for line in source:
-                user_id = RE.match(line).group('user_id')
-                targets[user_id[0]].write(line)
-            pieces = [f.path for f in os.scandir(dir)]
-            return pieces
+                user_id = int(RE.match(line).group('user_id'))
+                targets[piece_of(user_id, n_pieces)].write(line)
+    pieces = [f.name for f in targets]
+    piece_balance(pieces)
+    return pieces
+
+
+def to_arrow(piece, read_kws=None):
+    """Parse CSV piece into typed Arrow IPC piece and return its path.
+
+    The CSV piece is deleted.
+    """
+    path = os.path.splitext(piece)[0] + ARROW_SUFFIX
+    write_arrow(read_raw(piece, **(read_kws or {})), path)
+    os.remove(piece)
+    return path
+
+
+@timer
+def type_pieces(pieces, read_kws=None, max_workers=None, backend='process',
+                address=None):
+    """Parse CSV pieces in parallel into typed Arrow IPC pieces.
+
+    `read_kws` are passed to `read_raw`. Cleaning workers then read the
+    pieces memory-mapped instead of parsing CSV, and repeated reads of a
+    piece (e.g. by `copy_report` or with a cold step cache) parse it once.
+    Pieces are parsed by workers of backend (see `executors`).
+    """
+    with executors.executor(backend, max_workers, address) as pool:
+        return list(pool.map(to_arrow, pieces, [read_kws] * len(pieces)))
+
+
+def read_span(filepath, span, read_kws=None):
+    """Read range of raw file (see `ranges`)."""
+    if compressed.is_compressed(filepath):
+        data = compressed.read_block_range(filepath, *span)
+    else:
+        data = read_byte_range(filepath, *span)
+    return read_raw(io.BytesIO(data), **(read_kws or {}))
+
+
+def read_range(filepath, i, span, n_pieces, parts_dir, read_kws=None):
+    """Read i-th range of raw file and write its rows to parts by piece.
 
+    The part of each piece of users is written to an Arrow file in
+    parts_dir (see `parts_dir`), named by piece and range. Returns dict of
+    paths of parts by piece.
+    """
+    df = read_span(filepath, span, read_kws)
+    pieces = piece_of(df.user_id.to_numpy('int64'), n_pieces)
+    paths = {}
+    for n, part in df.groupby(pieces):
+        path = os.path.join(parts_dir, f'{n}_{i}{ARROW_SUFFIX}')
+        paths[n] = write_arrow(part, path)
+    return paths
 
-def clean_df(piece):
-    """Clean a single piece."""
+
+def load_parts(paths):
+    """Return rows of piece from its parts written by `read_range`."""
+    return concat_frames([read_arrow(path) for path in paths])
+
+
+def clean_parts(paths, drops=None, fused=False, lazy=False):
+    """Clean piece from its parts written by `read_range`.
+
+    See `clean_frame`.
+    """
+    return clean_frame(load_parts(paths), drops, fused, lazy)
+
+
+@contextlib.contextmanager
+def parts_dir(root=None, local=True):
+    """Yield new directory for parts of pieces, removed afterwards.
+
+    The directory is created in root, e.g. an s3 path or a network file
+    system shared by all workers, or else in the local temporary directory,
+    which only workers on this machine (`local`) can reach.
+    """
+    if root is None:
+        if not local:
+            raise ValueError('Workers on other machines need a parts '
+                             'directory shared with them.')
+        with tempfile.TemporaryDirectory() as path:
+            yield path
+        return
+    path = os.path.join(root, f'parts_{uuid.uuid4().hex}')
+    fs = aws.filesystem(path)
+    fs.makedirs(path, exist_ok=True)
+    try:
+        yield path
+    finally:
+        aws.invalidate(path)
+        if fs.exists(path):
+            fs.rm(path, recursive=True)
+
+
+def read_since(filepath, span, start=None, read_kws=None):
+    """Read range of raw file and return its txns from start date on."""
+    df = read_span(filepath, span, read_kws)
+    if start is not None:
+        df = df[df.transaction_date >= start].reset_index(drop=True)
+    return df
+
+
+def concat_frames(dfs):
+    """Concatenate frames, keeping categoricals categorical.
+
+    See `vocab.concat`.
+    """
+    return pd.DataFrame({col: vocab.concat([df[col].array for df in dfs])
+                         for col in dfs[0]})
+
+
+def clean_frame(df, drops=None, fused=False, lazy=False):
+    """Clean raw data of a single piece.
+
+    Drops columns after each step as planned by `columns.plan`, if given.
+    With `lazy`, rows are only filtered when a step needs the filtered data
+    and with `fused`, selectors are run on a table of users (see
+    `deferred.run`).
+    """
     funcs = cleaner_funcs + selector_funcs
-    clean = read_raw(piece)
-    for func in funcs:
-        clean = func(clean)
-    return clean
+    if drops is None:
+        drops = [set()] * len(funcs)
+    if fused or lazy:
+        return deferred.run(df, funcs, drops, fused, lazy)
+    for func, dropped in zip(funcs, drops):
+        df = func(df)
+        if dropped:
+            df = prune(df, dropped)
+    return df
+
+
+def clean_df(piece, use_cache=False, read_kws=None, drops=None,
+             fused=False, lazy=False):
+    """Clean a single piece.
+
+    `read_kws` are passed to `read_raw`. With `use_cache`, resume from the
+    last step whose result is cached, which requires running all steps one
+    by one.
+    """
+    if use_cache:
+        if fused or lazy:
+            raise ValueError('Cached steps cannot be fused or deferred.')
+        funcs = cleaner_funcs + selector_funcs
+        return cache.run(piece, read_raw, funcs, read_kws, drops)
+    return clean_frame(read_raw(piece, **(read_kws or {})), drops, fused,
+                       lazy)
+
+
+def clean_columns(func, *args, out_dir=None, vocabulary=None):
+    """Run cleaning func in a worker and return data as dict of columns.
+
+    Columns are pickled separately, so that the parent can free each column
+    of a piece once it is merged (see `merge_sorted`). With `out_dir`, the
+    data is instead written to an Arrow file in out_dir and only its path
+    is returned, which avoids pickling the data and sending it through the
+    result pipe (see `load_columns`). Categoricals are encoded with the
+    categories in `vocabulary`, if given (see `vocab`).
+
+    Workers of all backends may clean several pieces, so sample counts are
+    reset before and copied after each piece.
+    """
+    count.clear()
+    df, counts = func(*args)
+    counts = OrderedCounter(counts)
+    if vocabulary:
+        df = vocab.encode(df, vocabulary)
+    if out_dir is not None:
+        fd, path = tempfile.mkstemp(ARROW_SUFFIX, dir=out_dir)
+        os.close(fd)
+        return write_arrow(df, path), counts
+    return {col: df[col].array for col in df}, counts
+
+
+def load_columns(path):
+    """Return dict of columns of Arrow file written by `clean_columns`.
+
+    The file is memory-mapped, so pages written by the worker to shared
+    memory are read in place rather than copied through a pipe.
+    """
+    df = read_arrow(path)
+    return {col: df[col].array for col in df}
+
+
+def result_dir(shared, local=True):
+    """Return context of directory for worker results, if shared.
+
+    Uses shared memory (`/dev/shm`) where available, which must have room
+    for all cleaned pieces. Only workers on this machine (`local`) can
+    share memory with the parent.
+    """
+    if not shared:
+        return contextlib.nullcontext()
+    if not local:
+        raise ValueError('Results can only be shared by local workers.')
+    return tempfile.TemporaryDirectory(dir=SHM_DIR)
+
+
+def merge_sorted(pieces):
+    """Merge cleaned pieces into one dataframe sorted by user and date.
+
+    Pieces are dicts of columns (see `clean_columns`) of user-disjoint data
+    sorted by user and date, so ordering the blocks of rows of each user by
+    user id sorts the data without comparing rows. Columns are merged one
+    at a time and removed from the pieces, so the parent holds a single
+    copy of the data plus one column. Categoricals stay categorical (see
+    `vocab.concat`).
+    """
+    if not pieces:
+        return pd.DataFrame()
+    users, starts, lengths = [], [], []
+    offset = 0
+    for piece in pieces:
+        user = np.asarray(piece['user_id'])
+        if np.any(np.diff(user) < 0):
+            raise ValueError('Pieces must be sorted by user.')
+        start = np.flatnonzero(np.diff(user, prepend=user[:1] - 1))
+        users.append(user[start])
+        starts.append(start + offset)
+        lengths.append(np.diff(start, append=len(user)))
+        offset += len(user)
+    users, starts, lengths = map(np.concatenate, [users, starts, lengths])
+    order = np.argsort(users, kind='stable')
+    starts, lengths = starts[order], lengths[order]
+    # row j of a block moves from position start + j to its new position
+    new_starts = np.cumsum(lengths) - lengths
+    idx = np.repeat(starts - new_starts, lengths) + np.arange(offset)
+
+    df = pd.DataFrame(index=pd.RangeIndex(offset))
+    for col in list(pieces[0]):
+        merged = vocab.concat([p.pop(col) for p in pieces])
+        df[col] = merged.array.take(idx)
+    return df
+
+
+def combine(todo):
+    """Collect cleaned pieces from futures and merge.
+
+    See `merge_sorted`.
+    """
+    done = futures.as_completed(todo)
+    done = tqdm(done, total=len(todo), ncols=95)
+    sample_count = OrderedCounter()
+    clean_pieces = []
+    for future in done:
+        piece, count = future.result()
+        if isinstance(piece, str):
+            piece = load_columns(piece)
+        clean_pieces.append(piece)
+        sample_count.update(count)
+    return merge_sorted(clean_pieces), sample_count
 
 
 @timer
-def clean_data(raw_pieces):
-    """Clean raw pieces in parallel and combine."""
-    with futures.ProcessPoolExecutor() as pool:
-        todo = [pool.submit(clean_df, piece) for piece in raw_pieces]
-        done = futures.as_completed(todo)
-        done = tqdm(done, total=len(todo), ncols=95)
-        sample_count = OrderedCounter()
-        clean_pieces = []
-        for future in done:
-            piece, count = future.result()
-            clean_pieces.append(piece)
-            sample_count.update(count)
-        vars = ['user_id', 'transaction_date']
-        df = (pd.concat(clean_pieces)
-              .reset_index(drop=True)
-              .sort_values(vars))
-        return df, sample_count
-
-
-def save_data(df, sample):
+def clean_data(raw_pieces, max_workers=None, use_cache=False,
+               read_kws=None, drops=None, fused=False, lazy=False,
+               shared=False, backend='process', address=None,
+               vocabulary=None):
+    """Clean raw pieces in parallel and combine.
+
+    Largest pieces are submitted first so that no worker is left with a
+    large piece at the end of the run. Pieces are cleaned by workers of
+    backend (see `executors`), which encode categoricals with the
+    categories in `vocabulary` and, with `shared`, return pieces through
+    memory-mapped files (see `clean_columns`). Cleaned pieces are merged in
+    the parent (see `combine`).
+    """
+    raw_pieces = sorted(raw_pieces, key=os.path.getsize, reverse=True)
+    local = executors.is_local(backend, address)
+    with result_dir(shared, local) as out_dir:
+        with executors.executor(backend, max_workers, address) as pool:
+            todo = [pool.submit(clean_columns, clean_df, piece, use_cache,
+                                read_kws, drops, fused, lazy,
+                                out_dir=out_dir, vocabulary=vocabulary)
+                    for piece in raw_pieces]
+            return combine(todo)
+
+
+@timer
+def ingest_data(filepath, n_pieces=None, max_workers=None,
+                read_kws=None, drops=None, fused=False, lazy=False,
+                shared=False, backend='process', address=None,
+                vocabulary=None, parts_root=None):
+    """Read byte ranges of raw file in parallel, clean and combine.
+
+    Workers parse one byte range each and write its rows to a part file
+    per piece of users (see `read_range`), and workers clean each piece
+    from its parts, so only paths of parts pass through the parent. Any
+    range can contain rows of any user, so pieces are only cleaned once
+    all ranges are read: reading and cleaning do not overlap. The parts
+    are a temporary typed copy of the data, on disk rather than in the
+    parent's memory, like the pieces written by `split_file`. Ranges are
+    read and pieces cleaned by workers of backend (see `executors`), which
+    encode categoricals with the categories in `vocabulary` and, with
+    `shared`, return cleaned pieces through memory-mapped files (see
+    `clean_columns`). Workers on other machines need `parts_root`, a
+    directory shared with them (see `parts_dir`).
+
+    Cleaned pieces are still merged in the parent (see `combine`), which
+    holds all cleaned data, whatever the backend.
+    """
+    if n_pieces is None:
+        n_pieces = number_of_pieces(filepath)
+    spans = ranges(filepath, n_pieces)
+    local = executors.is_local(backend, address)
+    with result_dir(shared, local) as out_dir:
+        with parts_dir(parts_root, local) as parts:
+            with executors.executor(backend, max_workers, address) as pool:
+                reads = [pool.submit(read_range, filepath, i, span,
+                                     n_pieces, parts, read_kws)
+                         for i, span in enumerate(spans)]
+                paths = collections.defaultdict(list)
+                # parts in order of ranges, so rows stay in file order
+                for future in reads:
+                    for n, path in future.result().items():
+                        paths[n].append(path)
+                todo = [pool.submit(clean_columns, clean_parts, paths[n],
+                                    drops, fused, lazy, out_dir=out_dir,
+                                    vocabulary=vocabulary)
+                        for n in sorted(paths)]
+                return combine(todo)
+
+
+def column_plan(filepath, keep=None):
+    """Return columns to read and to drop after each step.
+
+    See `columns.plan`.
+    """
+    columns = read_raw(filepath, nrows=0).columns
+    return plan(columns, cleaner_funcs + selector_funcs, keep)
+
+
+def estimate_rows(filepath, sample_rows=10_000):
+    """Return number of rows estimated from file size and first rows."""
+    with aws.s3open(filepath, 'rb') as f:
+        lines = list(itertools.islice(f, sample_rows + 1))
+    return file_size(filepath) / (sum(map(len, lines)) / len(lines))
+
+
+def read_sample(filepath, read_kws=None, sample_rows=100_000, n_spans=10):
+    """Return about sample_rows rows read from n_spans places of file.
+
+    Ids grow through an extract, so the first rows alone understate their
+    range. Compressed files are sampled from the start. Columns are not
+    downcast.
+    """
+    read_kws = {**(read_kws or {}), 'dtypes': None}
+    if compressed.is_compressed(filepath):
+        return read_raw(filepath, nrows=sample_rows, **read_kws)
+    row_bytes = file_size(filepath) / estimate_rows(filepath)
+    span_bytes = int(sample_rows / n_spans * row_bytes)
+    parts = [read_span(filepath, (start, min(end, start + span_bytes)),
+                       read_kws)
+             for start, end in byte_ranges(filepath, n_spans)]
+    return concat_frames(parts)
+
+
+def plan_dtypes(filepath, read_kws=None, sample_rows=100_000):
+    """Return dtypes to downcast columns to, planned on a sample.
+
+    See `optimise.plan`. Pass them to `read_raw` as `dtypes` (e.g. in
+    `read_kws`) so that all pieces are read with the same dtypes.
+    """
+    return optimise.plan(read_sample(filepath, read_kws, sample_rows))
+
+
+def memory_report(filepath, read_kws=None, sample_rows=100_000):
+    """Print dtype and memory of each column before and after downcasting.
+
+    See `optimise`. Measured on a sample of `sample_rows` rows (see
+    `read_sample`), on which dtypes are planned as in a run, and scaled to
+    the number of rows estimated from the file size.
+    """
+    before = read_sample(filepath, read_kws, sample_rows)
+    after = optimise.apply(before.copy(), optimise.plan(before))
+    n_rows = estimate_rows(filepath, sample_rows)
+    table = optimise.memory_table(before, after, n_rows)
+    with pd.option_context('display.max_rows', None):
+        print(f'Estimated rows: {n_rows:,.0f}')
+        print(table.round(2))
+
+
+def dry_run(filepath, keep=None, sample_rows=10_000):
+    """Print live columns and estimated memory use after each step.
+
+    Memory per column is measured on the first `sample_rows` rows and
+    scaled to the number of rows estimated from the file size.
+    """
+    to_read, drops = column_plan(filepath, keep)
+    sample = read_raw(filepath, to_read, nrows=sample_rows)
+    row_bytes = sample.memory_usage(deep=True, index=False) / len(sample)
+    n_rows = estimate_rows(filepath, sample_rows)
+    table = live_columns(to_read, cleaner_funcs + selector_funcs, drops)
+    table = memory_estimate(table, row_bytes.to_dict(), n_rows)
+    with pd.option_context('max_colwidth', None, 'display.width', 200,
+                           'display.max_rows', None):
+        print(f'Estimated rows: {n_rows:,.0f}')
+        print(table[['step', 'n_cols', 'est_mb', 'columns']])
+
+
+def copy_report(piece, read_kws=None, drops=None):
+    """Print MB copied to filter rows by step, eagerly and deferred.
+
+    Copies for deferred filters are listed under the step that needs the
+    filtered data.
+    """
+    raw = read_raw(piece, **(read_kws or {}))
+    modes = {
+        'eager': {},
+        'lazy': dict(lazy=True),
+        'lazy_fused': dict(lazy=True, fused=True),
+    }
+    table = {}
+    for mode, kws in modes.items():
+        copied.clear()
+        clean_frame(raw.copy(), drops, **kws)
+        table[mode] = pd.Series(copied, dtype=float) / 2**20
+    table = pd.DataFrame(table).fillna(0)
+    table.loc['total'] = table.sum()
+    print(table.round(1))
+
+
+def save_data(df, sample, partition_cols=None, n_buckets=64, append=False):
+    """Save clean data as single parquet file or partitioned dataset.
+
+    Partitioning by `user_bucket` groups users into `n_buckets` buckets using
+    the same hash as `split_file`. With `append`, existing partitions not in
+    df are kept (see `aws.s3write_parquet_dataset`).
+    """
     name = f'data_{sample}.parquet'
     path = os.path.join(config.TEMPDIR, name)
-    df.to_parquet(path)
+    if not partition_cols:
+        df.to_parquet(path)
+        return
+    if 'user_bucket' in partition_cols:
+        # add bucket to a shallow copy, which leaves the caller's df as is
+        df = df.copy(deep=False)
+        df['user_bucket'] = piece_of(df.user_id.to_numpy('int64'), n_buckets)
+    aws.s3write_parquet_dataset(df, path, partition_cols, append=append)
+
+
+def update_data(filepath, sample, read_kws=None, n_pieces=None,
+                max_workers=None, backend='process', address=None):
+    """Clean months of raw file from the watermark and write to panel.
+
+    See `incremental`. The first run processes the full history. Ranges
+    of the raw file are read in parallel by workers of backend (see
+    `executors`), which only return the txns to be cleaned, so the history
+    before them is never held at once. Saves the cleaned months to the
+    panel partitioned by `ym`, replacing the watermark month, the updated
+    state of monthly summaries, the ids of selected users, the extended
+    vocabulary of categoricals (see `vocab`), the dtypes downcast to, if
+    any, which later runs reuse, and, last, the new watermark, so that an
+    interrupted update is redone by the next run.
+    """
+    def path(name):
+        return os.path.join(config.TEMPDIR, f'{name}_{sample}')
+    watermark = incremental.load_watermark(path('watermark') + '.json')
+    dtypes_path = path('dtypes') + '.json'
+    dtypes = (read_kws or {}).get('dtypes')
+    if dtypes is not None:
+        # downcast to the dtypes of the first run so partitions share a
+        # schema
+        saved = optimise.load(dtypes_path)
+        dtypes = dtypes if saved is None else saved
+        read_kws = {**read_kws, 'dtypes': dtypes}
+    vocab_path = path('vocab') + '.json'
+    vocabulary = vocab.load(vocab_path)
+    # months up to done are final, later ones are cleaned (again)
+    done = start = None
+    if watermark is not None:
+        done = incremental.previous_month(watermark)
+        start = incremental.window_start(done)
+    if n_pieces is None:
+        n_pieces = number_of_pieces(filepath)
+    spans = ranges(filepath, n_pieces)
+    n = len(spans)
+    with executors.executor(backend, max_workers, address) as pool:
+        parts = list(pool.map(read_since, [filepath] * n, spans,
+                              [start] * n, [read_kws] * n))
+    df = concat_frames(parts)
+    del parts
+    for func in cleaner_funcs:
+        df = func(df)
+    if done is not None:
+        df = df[df.ym > done].reset_index(drop=True)
+    if df.empty:
+        print(f'No complete months from {watermark}.')
+        return
+    state_path = path('state') + '.parquet'
+    state = (pd.read_parquet(state_path) if os.path.exists(state_path)
+             else None)
+    state = incremental.update(state, df, done)
+    df = vocab.encode(df, vocabulary)
+    save_data(df, sample, ['ym'], append=True)
+    state.to_parquet(state_path)
+    selected = pd.DataFrame({'user_id': incremental.select(state)})
+    selected.to_parquet(path('users') + '.parquet')
+    vocab.save(vocab.extend(vocabulary, df), vocab_path)
+    if dtypes is not None:
+        optimise.save(dtypes, dtypes_path)
+    incremental.save_watermark(path('watermark') + '.json', df.ym.max())
+    print(f'Wrote {df.ym.nunique()} months ({len(df):,} txns) from '
+          f'{df.ym.min()} to {df.ym.max()}; {len(selected):,} users '
+          f'selected.')
 
 
 def parse_args(argv):
@@ -111,6 +666,69 @@ def parse_args(argv):
         '-p', '--profile', action='store_true', help='run in profiling mode.')
     parser.add_argument(
         '-mp', '--memprof', action='store_true', help='run memory profiler.')
+    parser.add_argument(
+        '-n', '--pieces', type=int, help='number of pieces (default: cores).')
+    parser.add_argument(
+        '-s', '--piece-size', type=int, help='target piece size in MB.')
+    parser.add_argument(
+        '-w', '--workers', type=int, help='number of worker processes.')
+    parser.add_argument(
+        '-b', '--backend', choices=executors.BACKENDS, default='process',
+        help='executor running workers (default: process).')
+    parser.add_argument(
+        '--address',
+        help='address of dask or ray cluster (default: start local one).')
+    parser.add_argument(
+        '-i', '--ingest', action='store_true',
+        help='read byte ranges of raw file instead of splitting it.')
+    parser.add_argument(
+        '--parts-dir',
+        help='directory shared with all workers (e.g. s3 path) for parts of '
+             'pieces when ingesting (default: local temporary directory).')
+    parser.add_argument(
+        '-P', '--partition-by', nargs='+', choices=['ym', 'user_bucket'],
+        help='save data as dataset partitioned by given columns.')
+    parser.add_argument(
+        '-c', '--cache', action='store_true',
+        help='cache results of each step and resume from last unchanged one.')
+    parser.add_argument(
+        '--clear-cache', action='store_true', help='clear cache before run.')
+    parser.add_argument(
+        '-k', '--keep', nargs='+',
+        help='columns to keep in final data (default: all).')
+    parser.add_argument(
+        '--dry-run', action='store_true',
+        help='print live columns and estimated memory after each step.')
+    parser.add_argument(
+        '--categorical', action='store_true',
+        help='read low-cardinality string columns as categoricals.')
+    parser.add_argument(
+        '-e', '--engine', choices=['c', 'pyarrow'], default='c',
+        help='CSV parser used to read raw data (default: c).')
+    parser.add_argument(
+        '--downcast', action='store_true',
+        help='downcast columns to smallest safe dtype planned on a sample.')
+    parser.add_argument(
+        '--memory', action='store_true',
+        help='print memory of each column before and after downcasting.')
+    parser.add_argument(
+        '-f', '--fused', action='store_true',
+        help='run selectors on a table of users and filter txns once.')
+    parser.add_argument(
+        '-l', '--lazy', action='store_true',
+        help='only filter rows when a step needs the filtered data.')
+    parser.add_argument(
+        '-a', '--arrow', action='store_true',
+        help='parse split pieces once into memory-mapped Arrow files.')
+    parser.add_argument(
+        '--shared', action='store_true',
+        help='return cleaned pieces from workers through shared memory.')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='only clean months after the last run and append to panel.')
+    parser.add_argument(
+        '--copies', action='store_true',
+        help='print MB copied to filter rows of a piece by step and mode.')
     return parser.parse_args()
 
 
@@ -119,23 +737,58 @@ def main():
     args = parse_args(sys.argv)
     fn = f'data_{args.sample}.csv'
     fp = os.path.join(config.TEMPDIR, fn)
-    with tempfile.TemporaryDirectory() as tempdir:
-        print('splitting file...')
-        raw_pieces = split_file(fp, tempdir)
-        raw_pieces = raw_pieces[:2] if args.debug else raw_pieces
-        print('cleaning pieces...')
-        if args.profile:
-            cmd = 'clean_df(raw_pieces[5])'
-            pr = os.path.join(config.PROFDIR, 'data_profile')
-            cProfile.runctx(cmd, globals(), locals(), pr)
-            return 'Profile saved.'
-        df, count = clean_data(raw_pieces)
-        table = selection_table(count)
-        print(table)
-        if not args.debug:
-            save_selection_table(table, args.sample)
-            save_data(df, args.sample)
-
+    if args.clear_cache:
+        cache.clear()
+    if args.dry_run:
+        return dry_run(fp, args.keep)
+    columns, drops = column_plan(fp, args.keep)
+    read_kws = dict(columns=columns, categorical=args.categorical,
+                    engine=args.engine)
+    if args.memory:
+        return memory_report(fp, read_kws)
+    if args.downcast:
+        print('planning dtypes...')
+        read_kws['dtypes'] = plan_dtypes(fp, read_kws)
+    n_pieces = args.pieces or number_of_pieces(fp, args.piece_size)
+    if args.incremental:
+        print('cleaning new months...')
+        return update_data(fp, args.sample, read_kws, n_pieces,
+                           args.workers, args.backend, args.address)
+    vocab_path = os.path.join(config.TEMPDIR, f'vocab_{args.sample}.json')
+    vocabulary = vocab.load(vocab_path)
+    if args.ingest:
+        print('ingesting and cleaning file...')
+        df, count = ingest_data(fp, n_pieces, args.workers, read_kws, drops,
+                                args.fused, args.lazy, args.shared,
+                                args.backend, args.address, vocabulary,
+                                args.parts_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tempdir:
+            print('splitting file...')
+            raw_pieces = split_file(fp, tempdir, n_pieces)
+            raw_pieces = raw_pieces[:2] if args.debug else raw_pieces
+            if args.arrow:
+                print('typing pieces...')
+                raw_pieces = type_pieces(raw_pieces, read_kws, args.workers,
+                                         args.backend, args.address)
+            print('cleaning pieces...')
+            if args.profile:
+                cmd = 'clean_df(raw_pieces[5])'
+                pr = os.path.join(config.PROFDIR, 'data_profile')
+                cProfile.runctx(cmd, globals(), locals(), pr)
+                return 'Profile saved.'
+            if args.copies:
+                return copy_report(raw_pieces[0], read_kws, drops)
+            df, count = clean_data(raw_pieces, args.workers, args.cache,
+                                   read_kws, drops, args.fused, args.lazy,
+                                   args.shared, args.backend, args.address,
+                                   vocabulary)
+    table = selection_table(count)
+    print(table)
+    if not args.debug:
+        save_selection_table(table, args.sample)
+        save_data(df, args.sample, args.partition_by)
+        vocab.save(vocab.extend(vocabulary, df), vocab_path)
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,140 @@
+"""Downcast columns of loaded data to their smallest safe dtype.
+
+Integer columns are downcast to the smallest integer type holding their
+values, float64 columns to float32 if no value changes, and string columns
+with few distinct values to categoricals. Columns written by a cleaner
+(see `decorators.cleaner`) keep their dtype, as assigning values outside
+the range or categories of a downcast column would fail or wrap around.
+
+Dtypes are planned once on a sample of the raw file (`plan`) and the same
+plan is applied to every piece (`apply`), so that pieces can be
+concatenated without upcasting and appended partitions share a schema.
+Integer types leave room for values as far beyond the sampled range as
+the range is wide, as ids grow with each extract. Pieces with values
+outside the planned type raise an error rather than being cast.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .decorators import cleaner_funcs
+
+
+# string columns with at most this share of distinct values become
+# categoricals
+CATEGORY_RATIO = 0.5
+
+
+def written_columns():
+    """Return columns written by registered cleaners."""
+    return {col for func in cleaner_funcs for col in func.outputs}
+
+
+def smallest(s):
+    """Return column as smallest dtype holding all its values."""
+    if s.dtype.kind in 'iu':
+        return pd.to_numeric(s, downcast='integer')
+    if s.dtype == 'float64':
+        small = s.astype('float32')
+        if np.array_equal(small.to_numpy('float64'), s.to_numpy(),
+                          equal_nan=True):
+            return small
+        return s
+    if s.dtype == object:
+        n = s.count()
+        if n and s.nunique() <= CATEGORY_RATIO * n:
+            return s.astype('category')
+    return s
+
+
+def int_dtype(s):
+    """Return smallest integer dtype holding values of s with headroom."""
+    lo, hi = s.min(), s.max()
+    room = hi - lo
+    lo, hi = lo - room if lo < 0 else 0, hi + room
+    for dtype in ['int8', 'int16', 'int32']:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return str(s.dtype)
+
+
+def plan(sample, fixed=None):
+    """Return dict of dtypes to downcast columns of sample to.
+
+    Columns in fixed, which defaults to columns written by cleaners, are
+    left as they are.
+    """
+    if fixed is None:
+        fixed = written_columns()
+    dtypes = {}
+    for col in sample.columns.difference(fixed, sort=False):
+        s = sample[col]
+        if s.dtype.kind in 'iu' and len(s):
+            dtype = int_dtype(s)
+        else:
+            dtype = str(smallest(s).dtype)
+        if dtype != str(s.dtype):
+            dtypes[col] = dtype
+    return dtypes
+
+
+def apply(df, dtypes):
+    """Cast columns of df to planned dtypes.
+
+    Raises ValueError if integers do not fit their planned type.
+    """
+    for col, dtype in dtypes.items():
+        if col not in df:
+            continue
+        s = df[col]
+        if s.dtype.kind in 'iu' and len(s):
+            info = np.iinfo(dtype)
+            if s.min() < info.min or s.max() > info.max:
+                raise ValueError(
+                    f'Values of {col} outside planned {dtype}; plan dtypes '
+                    f'again (e.g. delete the saved plan).')
+        df[col] = s.astype(dtype)
+    return df
+
+
+def downcast(df, fixed=None):
+    """Downcast columns of df other than those in fixed.
+
+    fixed defaults to columns written by cleaners. Dtypes are chosen on df
+    alone, so use `plan` and `apply` for data read in pieces.
+    """
+    return apply(df, plan(df, fixed))
+
+
+def load(path):
+    """Return saved plan of dtypes, or None if missing."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(dtypes, path):
+    with open(path, 'w') as f:
+        json.dump(dtypes, f)
+
+
+def memory_table(before, after, n_rows=None):
+    """Return table of dtype and memory of each column before and after.
+
+    Memory is scaled to n_rows, if given.
+    """
+    scale = 1 if n_rows is None else n_rows / max(len(before), 1)
+    table = pd.DataFrame({
+        'dtype': before.dtypes.astype(str),
+        'mb': before.memory_usage(deep=True, index=False) * scale / 2**20,
+        'new_dtype': after.dtypes.astype(str),
+        'new_mb': after.memory_usage(deep=True, index=False) * scale / 2**20,
+    })
+    table.loc['total'] = ['', table.mb.sum(), '', table.new_mb.sum()]
+    table['saved'] = 1 - table.new_mb / table.mb
+    return table
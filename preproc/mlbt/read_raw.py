@@ -1,7 +1,35 @@
+import contextlib
+import io
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv, feather
+
+import aws
+
+from . import compressed, optimise
+
 
+# suffix of typed pieces written by `write_arrow`
+ARROW_SUFFIX = '.arrow'
 
-def read(path):
+# missing values in non-string columns, pandas' defaults (as of 1.5)
+NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan',
+    'null',
+]
+
+
+def read(path, columns=None, nrows=None, categorical=False, engine='c'):
+    """Read raw data.
+
+    Read all columns or, if given, only the raw columns whose names after
+    renaming are in `columns`. With `categorical`, low-cardinality string
+    columns are returned as categoricals. `engine` is 'c' for pandas' parser
+    or 'pyarrow' for pyarrow's multithreaded one (see `read_pyarrow`).
+    """
     dtypes = {
         'Transaction Reference': 'int32',
         'User Reference': 'int32',
@@ -22,18 +50,134 @@ def read(path):
         'Credit Debit', 'User Precedence Tag Name', 'Manual Tag Name',
         'Auto Purpose Tag Name', 'Merchant Name', 'Merchant Business Line',
     ]
-    str_cleaner = dict.fromkeys(strings, lambda x: x.lower().strip())
+    categories = [
+        'Salary Range', 'Derived Gender', 'Provider Group Name',
+        'Account Type', 'Credit Debit', 'User Precedence Tag Name',
+        'Manual Tag Name', 'Auto Purpose Tag Name', 'Merchant Business Line',
+    ]
 
     def col_selector(col_name):
         ignore = [
             'LSOA', 'MSOA', 'Data Warehouse Date Last Updated',
             'Transaction Updated Flag', 'Data Warehouse Date Created'
         ]
+        if columns is not None and clean_name(col_name) not in columns:
+            return False
         return col_name not in ignore
 
-    return pd.read_csv(path, sep='|', parse_dates=dates,
-                       usecols=col_selector, dtype=dtypes,
-                       converters=str_cleaner)
+    dates = [col for col in dates if col_selector(col)]
+    # local files are parsed faster from their path than from a file
+    local = (isinstance(path, str) and not is_remote(path)
+             and not compressed.is_compressed(path))
+    if compressed.is_compressed(path):
+        # decompress blocks in parallel rather than in the parser
+        source = compressed.open_parallel(path, 'rb')
+    elif isinstance(path, str):
+        source = aws.s3open(path, 'rb')
+    else:
+        source = contextlib.nullcontext(path)
+    with source as src:
+        # parse header once and read the data after it (or skip it)
+        header = pd.read_csv(io.BytesIO(src.readline()), sep='|',
+                             nrows=0).columns
+        data = path if local else src
+        # read strings verbatim (empty fields stay empty strings) and only
+        # parse missing values in other columns
+        nas = dict.fromkeys(header.difference(strings), NA_VALUES)
+        if engine == 'pyarrow':
+            usecols = [col for col in header if col_selector(col)]
+            df = read_pyarrow(data, usecols, dtypes, dates, strings,
+                              NA_VALUES, nrows, names=list(header),
+                              skip=int(local))
+        else:
+            df = pd.read_csv(data, sep='|', header=0 if local else None,
+                             names=header, parse_dates=dates,
+                             usecols=col_selector,
+                             dtype={**dtypes, **dict.fromkeys(strings, str)},
+                             keep_default_na=False, na_values=nas,
+                             nrows=nrows)
+    strings = [col for col in strings if col in df]
+    return normalise_strings(df, strings, categories if categorical else ())
+
+
+def read_pyarrow(path, usecols, dtypes, dates, strings, na_values,
+                 nrows=None, names=None, skip=0):
+    """Read raw data with pyarrow's multithreaded CSV reader.
+
+    Returns the same columns and dtypes as pandas' parser does in `read`:
+    strings are read verbatim and only other columns have missing values.
+    Column `names`, if given, replace the header, whose `skip` lines are
+    skipped (none if path is a file positioned after the header).
+    """
+    types = {col: pa.from_numpy_dtype(np.dtype(dtype))
+             for col, dtype in dtypes.items()}
+    types.update(dict.fromkeys(dates, pa.timestamp('ns')))
+    types.update(dict.fromkeys(strings, pa.string()))
+    kws = dict(
+        read_options=csv.ReadOptions(column_names=names, skip_rows=skip),
+        parse_options=csv.ParseOptions(delimiter='|'),
+        convert_options=csv.ConvertOptions(
+            column_types=types, include_columns=usecols,
+            null_values=na_values, strings_can_be_null=False),
+    )
+    if is_remote(path):
+        with aws.s3open(path) as f:
+            return read_pyarrow(f, usecols, dtypes, dates, strings,
+                                na_values, nrows, names, skip)
+    if nrows is None:
+        table = csv.read_csv(path, **kws)
+    else:
+        # read batches until enough rows, as there is no nrows option
+        reader = csv.open_csv(path, **kws)
+        batches, n = [], 0
+        while n < nrows:
+            try:
+                batches.append(reader.read_next_batch())
+            except StopIteration:
+                break
+            n += len(batches[-1])
+        table = pa.Table.from_batches(batches, reader.schema).slice(0, nrows)
+    return table.to_pandas()
+
+
+def read_byte_range(filepath, start, end):
+    """Return header and all lines of file that start in [start, end).
+
+    Works for local and s3 files, for which only the requested range (plus
+    the header and the end of the last line) is downloaded. `start` must
+    lie after the header.
+    """
+    with aws.s3open(filepath, 'rb') as f:
+        header = f.readline()
+        # skip remainder of line that starts in previous range
+        f.seek(start - 1)
+        f.readline()
+        data = f.read(max(0, end - f.tell()))
+        if data and not data.endswith(b'\n'):
+            data += f.readline()
+    return header + data
+
+
+def normalise_strings(df, columns, categorical=()):
+    """Lower-case and strip string columns.
+
+    Cleans the unique values of each column and maps them back to the rows,
+    which is much faster than calling a converter on every cell. Columns in
+    `categorical` are returned as categoricals.
+    """
+    for col in columns:
+        codes, uniques = pd.factorize(df[col])
+        clean = pd.Series(uniques, dtype=object).str.lower().str.strip()
+        if col in categorical:
+            # values that only differed before cleaning share a category
+            clean_codes, categories = pd.factorize(clean)
+            codes = np.append(clean_codes, -1).take(codes)
+            df[col] = pd.Categorical.from_codes(codes, categories)
+        else:
+            # missing values have code -1 and map to the appended NaN
+            clean = np.append(clean.to_numpy(), np.nan)
+            df[col] = clean.take(codes)
+    return df
 
 
 def clean_names(df):
@@ -61,9 +205,71 @@ def rename(df):
     return df.rename(columns=new_names)
 
 
-def read_raw(path):
-    return (
-        read(path)
+def clean_name(col_name):
+    """Return name of raw column after `clean_names` and `rename`."""
+    name = col_name.lower().replace(' ', '_').replace('.', '_').strip()
+    return rename(pd.DataFrame(columns=[name])).columns[0]
+
+
+def is_remote(path):
+    return isinstance(path, str) and '://' in path
+
+
+def write_arrow(df, path):
+    """Write data as uncompressed Arrow IPC (Feather) file.
+
+    Uncompressed files can be memory-mapped by `read_arrow`. The index is
+    not written. Paths on other file systems (e.g. s3) are written through
+    `aws`.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if is_remote(path):
+        with aws.s3open(path, 'wb') as f:
+            feather.write_feather(table, f, compression='uncompressed')
+    else:
+        feather.write_feather(table, path, compression='uncompressed')
+    return path
+
+
+def read_arrow(path, columns=None, nrows=None):
+    """Read Arrow IPC file written by `write_arrow`.
+
+    Local files are memory-mapped, so their pages are shared through the OS
+    cache by all processes reading them and only the selected columns are
+    touched. Files on other file systems are read through `aws`. Dtypes,
+    including categoricals, are those of the data written.
+    """
+    if is_remote(path):
+        with aws.s3open(path, 'rb') as f:
+            table = pa.ipc.open_file(f).read_all()
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([c for c in table.column_names if c in columns])
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    return table.to_pandas(split_blocks=True)
+
+
+def is_arrow(path):
+    return isinstance(path, str) and path.endswith(ARROW_SUFFIX)
+
+
+def read_raw(path, columns=None, nrows=None, categorical=False, engine='c',
+             dtypes=None):
+    """Read raw data, cleaning column names.
+
+    Typed pieces (see `write_arrow`) are read memory-mapped and hold
+    cleaned names already; `categorical` and `dtypes` apply when they
+    are written. Columns in `dtypes` are downcast to the dtypes planned by
+    `optimise.plan`, the same for all pieces.
+    """
+    if is_arrow(path):
+        return read_arrow(path, columns, nrows)
+    df = (
+        read(path, columns, nrows, categorical, engine)
         .pipe(clean_names)
         .pipe(rename)
     )
+    return optimise.apply(df, dtypes) if dtypes else df
@@ -1,8 +1,8 @@
-import pandas as pd
-from .decorators import count, counter, selector
+from . import users
+from .decorators import count, counter, per_row, per_user, selector
 
 
-@selector
+@selector(inputs=[])
 @counter
 def add_raw_count(df):
     """Raw sample.
@@ -10,114 +10,77 @@ def add_raw_count(df):
     return df
 
 
-@selector
+@selector(inputs=['user_id', 'ym'])
 @counter
-def min_number_of_months(df, min_months=6):
+@per_user(users.months)
+def min_number_of_months(table, min_months=6):
     """At least 6 months of data."""
-    cond = df.groupby('user_id').ym.nunique() >= min_months
-    users = cond[cond].index
-    return df[df.user_id.isin(users)]
+    return table.months >= min_months
 
 
-@selector
+@selector(inputs=['user_id', 'account_type'])
 @counter
-def current_account(df):
+@per_user(users.current_account)
+def current_account(table):
     """At least one current account."""
-    mask = df.account_type.eq('current')
-    users = df[mask].user_id.unique()
-    return df[df.user_id.isin(users)]
+    return table.current_account
 
 
-@selector
+@selector(inputs=['user_id', 'ym', 'amount'])
 @counter
-def min_spend(df, min_txns=10, min_spend=300):
+@per_user(users.monthly_spend)
+def min_spend(table, min_txns=10, min_spend=300):
     """At least 5 monthly debits totalling GBP200.
     Drops first and last month for each user due to possible incomplete data.
     """
-    data = df[['user_id', 'ym', 'amount']]
-    data = data[data.amount > 0]
+    return (table.min_debits >= min_txns) & (table.min_spend >= min_spend)
 
-    # drop first and last month for each user
-    g = data.groupby('user_id')
-    first_month = g.ym.transform(min)
-    last_month = g.ym.transform(max)
-    data = data[(data.ym > first_month) & (data.ym < last_month)]
 
-    # calculate monthly min spend and txns per user
-    g = data.groupby(['user_id', 'ym']).amount
-    spend = g.sum()
-    txns = g.size()
-    user_spend = spend.groupby('user_id').min()
-    user_txns = txns.groupby('user_id').min()
-
-    mask = (user_txns >= min_txns) & (user_spend >= min_spend)
-    users = mask[mask].index
-    return df[df.user_id.isin(users)]
-
-
-@selector
+@selector(inputs=['user_id', 'tag', 'ym'])
 @counter
-def income_pmts(df):
+@per_user(users.months, users.income_months)
+def income_pmts(table):
     """Income payments in 2/3 of all observed months."""
-    def helper(g):
-        tot_months = g.ym.nunique()
-        inc_months = g[g.tag.str.contains('_income')].ym.nunique()
-        return (inc_months / tot_months) > (2/3)
-    data = df[['user_id', 'transaction_date', 'tag', 'ym']]
-    usrs = data.groupby('user_id').filter(helper).user_id.unique()
-    return df[df.user_id.isin(usrs)]
+    return (table.income_months / table.months) > (2/3)
 
 
-@selector
+@selector(inputs=['user_id', 'transaction_date', 'tag', 'amount'])
 @counter
-def income_amount(df, lower=5_000, upper=100_000):
+@per_user(users.yearly_income)
+def income_amount(table, lower=5_000, upper=100_000):
     """Yearly incomes between 5k and 100k.
     Yearly income calculated on rolling basis from first month of data,
     last year excluded as it has probably incomplete data.
     """
-    def helper(g):
-        first_month = g.transaction_date.min().strftime('%b')
-        yearly_freq = 'AS-' + first_month.upper()
-        year = pd.Grouper(freq=yearly_freq, key='transaction_date')
-        yearly_inc = (g[g.tag.str.contains('_income')]
-                      .groupby(year)
-                      .amount.sum().mul(-1))
-        return yearly_inc[:-1].between(lower, upper).all()
-    return df.groupby('user_id').filter(helper)
-
-
-@selector
+    return ~(table.min_income < lower) & ~(table.max_income > upper)
+
+
+@selector(inputs=['user_id', 'ym', 'account_id'])
 @counter
-def max_accounts(df):
+@per_user(users.monthly_accounts)
+def max_accounts(table):
     """No more than 10 active accounts in any year."""
-    year = pd.Grouper(freq='M', key='transaction_date')
-    usr_max = (df.groupby(['user_id', year]).account_id.nunique()
-               .groupby('user_id').max())
-    users = usr_max[usr_max <= 10].index
-    return df[df.user_id.isin(users)]
+    return table.max_accounts <= 10
 
 
-@selector
+@selector(inputs=['user_id', 'ym', 'amount'])
 @counter
-def max_debits(df):
+@per_user(users.monthly_debits)
+def max_debits(table):
     """Debits of no more than 100k in any month."""
-    month = pd.Grouper(freq='M', key='transaction_date')
-    debits = df[df.amount > 0]
-    usr_max = (debits.groupby(['user_id', month]).amount.sum()
-               .groupby('user_id').max())
-    users = usr_max[usr_max <= 100_000].index
-    return df[df.user_id.isin(users)]
+    return table.max_debits <= 100_000
 
 
-@selector
+@selector(inputs=['year_of_birth'], rowwise=True)
 @counter
+@per_row
 def working_age(df):
     """Working-age."""
     age = 2020 - df.year_of_birth
-    return df[age.between(18, 64)]
+    return age.between(18, 64)
 
 
-@selector
+@selector(inputs=[])
 @counter
 def add_final_count(df):
     """Final sample.
@@ -125,7 +88,7 @@ def add_final_count(df):
     return df
 
 
-@selector
+@selector(inputs=[])
 def returner(df):
     """Return final data and counter."""
     return df, count
@@ -0,0 +1,85 @@
+"""Vectorised string operations evaluated on unique values.
+
+Tag and other string columns have few distinct values compared to the
+number of rows. The functions here factorize a column, apply the pandas
+string method to the unique values only, and map the result back to the
+rows through the codes. Missing values never match and stay missing when
+replacing. String results of categorical columns are categoricals.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Uniques:
+    """Factorized column for evaluating several patterns on its values."""
+
+    def __init__(self, s):
+        self.codes, uniques = pd.factorize(s)
+        self.uniques = pd.Series(uniques, dtype=object)
+        self.index = s.index
+        self.name = s.name
+        self.categorical = isinstance(s.dtype, pd.CategoricalDtype)
+
+    def apply(self, func, na_value):
+        """Apply func to unique values and map result back to rows."""
+        values = func(self.uniques).to_numpy()
+        if self.categorical and values.dtype == object:
+            value_codes, categories = pd.factorize(values)
+            codes = np.append(value_codes, -1).take(self.codes)
+            values = pd.Categorical.from_codes(codes, categories)
+            return pd.Series(values, index=self.index, name=self.name)
+        # missing values have code -1 and map to the appended na_value
+        values = np.append(values, na_value)
+        return pd.Series(values.take(self.codes), index=self.index,
+                         name=self.name)
+
+    def match(self, pattern):
+        """Like `s.str.match(pattern)`."""
+        return self.apply(lambda u: u.str.match(pattern), False)
+
+    def contains(self, pattern):
+        """Like `s.str.contains(pattern)`."""
+        return self.apply(lambda u: u.str.contains(pattern), False)
+
+    def replace(self, pattern, repl, regex=False):
+        """Like `s.str.replace(pattern, repl, regex=regex)`."""
+        return self.apply(
+            lambda u: u.str.replace(pattern, repl, regex=regex), np.nan)
+
+
+def on_uniques(s, func, na_value):
+    """Apply func to unique values of s and map result back to rows."""
+    return Uniques(s).apply(func, na_value)
+
+
+def match(s, pattern):
+    """Like `s.str.match(pattern)`."""
+    return Uniques(s).match(pattern)
+
+
+def contains(s, pattern):
+    """Like `s.str.contains(pattern)`."""
+    return Uniques(s).contains(pattern)
+
+
+def replace(s, pattern, repl, regex=False):
+    """Like `s.str.replace(pattern, repl, regex=regex)`."""
+    return Uniques(s).replace(pattern, repl, regex)
+
+
+def where(cond, x, y):
+    """Like `np.where(cond, x, y)` for string columns.
+
+    If x or y is categorical, the result is categorical with the union of
+    their categories, and values are selected on the codes.
+    """
+    is_cat = [isinstance(s.dtype, pd.CategoricalDtype) for s in (x, y)]
+    if not any(is_cat):
+        return np.where(cond, x, y)
+    x, y = (s if c else s.astype('category') for s, c in zip((x, y), is_cat))
+    categories = x.cat.categories.union(y.cat.categories)
+    x = x.cat.set_categories(categories)
+    y = y.cat.set_categories(categories)
+    codes = np.where(cond, x.cat.codes, y.cat.codes)
+    return pd.Categorical.from_codes(codes, categories)
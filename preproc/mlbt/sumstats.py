@@ -38,8 +38,8 @@ def main(argv=None):
     args = parse_args(argv)
     file = f'data_{args.sample}.parquet'
     path = os.path.join(config.TEMPDIR, file)
-    df = pd.read_parquet(path)
     varlist = ['bank', 'account_id']
+    df = pd.read_parquet(path, columns=['user_id', *varlist])
     tbl = sumstats_table(df, varlist)
     export_latex_table(tbl, name='sumstats.tex')
 
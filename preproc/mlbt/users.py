@@ -0,0 +1,104 @@
+"""Per-user features for user-level selectors.
+
+Each feature function returns a table indexed by user_id with a row for
+every user in df. User-level selectors (see `decorators.per_user`) keep
+users based on these features.
+"""
+
+import pandas as pd
+
+from . import strings
+
+
+def all_users(df, table):
+    """Return table with a row for each user in df, missing if not in table."""
+    return table.reindex(pd.Index(df.user_id.unique(), name='user_id'))
+
+
+def months(df):
+    """Number of observed months."""
+    return df.groupby('user_id').ym.nunique().to_frame('months')
+
+
+def current_account(df):
+    """Whether user has a current account."""
+    current = df.account_type.eq('current').groupby(df.user_id).any()
+    return current.to_frame('current_account')
+
+
+def monthly_spend(df):
+    """Lowest monthly spend and number of debits.
+    Ignores first and last month of each user due to possible incomplete data.
+    """
+    data = df[['user_id', 'ym', 'amount']]
+    data = data[data.amount > 0]
+    g = data.groupby('user_id')
+    first_month = g.ym.transform(min)
+    last_month = g.ym.transform(max)
+    data = data[(data.ym > first_month) & (data.ym < last_month)]
+    g = data.groupby(['user_id', 'ym']).amount
+    monthly = pd.DataFrame({'min_spend': g.sum(), 'min_debits': g.size()})
+    return all_users(df, monthly.groupby('user_id').min())
+
+
+def income_months(df):
+    """Number of months with income payments."""
+    is_income = strings.contains(df.tag, '_income')
+    inc_months = df[is_income].groupby('user_id').ym.nunique()
+    return all_users(df, inc_months.to_frame('income_months')).fillna(0)
+
+
+def yearly_income(df):
+    """Lowest and highest yearly income.
+
+    Years start on the first day of the month of a user's first txn. Years
+    without income between a user's first and last year of income count as
+    zero income. The last year is ignored as it has probably incomplete
+    data. Missing for users without any other year of income.
+    """
+    first_month = (df.groupby('user_id').transaction_date.transform('min')
+                   .dt.month)
+    is_income = strings.contains(df.tag, '_income').to_numpy()
+    date = df.transaction_date[is_income]
+    data = pd.DataFrame({
+        'user_id': df.user_id[is_income],
+        'year': date.dt.year - (date.dt.month < first_month[is_income]),
+        'amount': df.amount[is_income],
+    })
+    return all_users(df, income_range(data))
+
+
+def income_range(data):
+    """Return lowest and highest yearly income from incomes by year.
+
+    See `yearly_income`. data has columns user_id, year, and amount, with
+    incomes negative as in the txns.
+    """
+    yearly_inc = (data.groupby(['user_id', 'year']).amount.sum().mul(-1)
+                  .reset_index())
+    g = yearly_inc.groupby('user_id').year
+    n_years = g.max() - g.min()
+    is_last = yearly_inc.year.eq(g.transform('max'))
+    g = yearly_inc[~is_last].groupby('user_id').amount
+    table = pd.DataFrame({'min_income': g.min(), 'max_income': g.max()})
+    n_observed = g.size()
+    gaps = n_observed < n_years[n_observed.index]
+    table.loc[gaps, 'min_income'] = table.min_income[gaps].clip(upper=0)
+    table.loc[gaps, 'max_income'] = table.max_income[gaps].clip(lower=0)
+    return table
+
+
+def monthly_accounts(df):
+    """Highest number of accounts with txns in a month."""
+    active = df.groupby(['user_id', 'ym', 'account_id'], sort=False).size()
+    usr_max = (active.groupby(['user_id', 'ym']).size()
+               .groupby('user_id').max())
+    return usr_max.to_frame('max_accounts')
+
+
+def monthly_debits(df):
+    """Highest monthly debits."""
+    debits = df[df.amount > 0]
+    usr_max = (debits.groupby(['user_id', 'ym']).amount.sum()
+               .groupby('user_id').max())
+    return all_users(df, usr_max.to_frame('max_debits'))
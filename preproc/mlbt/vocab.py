@@ -0,0 +1,100 @@
+"""Shared dictionaries of categorical columns across pieces.
+
+Each piece encodes string columns with its own categories (see
+`str_to_cat`), so cleaned pieces cannot simply be concatenated: pandas
+turns categoricals with differing categories into objects. The vocabulary
+holds the categories of each column seen in previous runs, in the order
+first seen. Workers recode cleaned pieces so that these categories come
+first (`encode`), which gives all known values the same code in every
+piece, and `concat` merges pieces to the union of their categories, which
+is only computed for values new in this run. The vocabulary is then
+extended with the new values and saved for the next run, so codes are
+stable across monthly runs.
+
+Ordered categoricals have fixed categories and are left as they are.
+Columns with more than `MAX_CATEGORIES` categories, e.g. descriptions, are
+merged but not saved.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+MAX_CATEGORIES = 2**16
+
+
+def load(path):
+    """Return saved vocabulary, or an empty one if missing."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(vocabulary, path):
+    with open(path, 'w') as f:
+        json.dump(vocabulary, f)
+
+
+def unordered(df):
+    """Return names of unordered categorical columns of df."""
+    return [col for col, dtype in df.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype) and not dtype.ordered]
+
+
+def recode(cat, categories):
+    """Return categorical with categories first, then its other categories.
+
+    Only categories, not rows, are looked up.
+    """
+    old = cat.categories
+    new = pd.Index(categories, dtype=old.dtype)
+    new = new.append(old.difference(new, sort=False))
+    if new.equals(old):
+        return cat
+    # missing values have code -1, which picks the appended -1
+    mapping = np.append(new.get_indexer(old), -1)
+    return pd.Categorical.from_codes(mapping[cat.codes], new)
+
+
+def encode(df, vocabulary):
+    """Recode categorical columns of df to the categories in vocabulary."""
+    for col in unordered(df):
+        if col in vocabulary:
+            df[col] = recode(df[col].array, vocabulary[col])
+    return df
+
+
+def concat(arrays):
+    """Concatenate columns of pieces.
+
+    Categoricals are recoded to the union of their categories, which keeps
+    the categories of the first piece first and only concatenates codes if
+    all pieces have the same categories. Other columns are concatenated
+    like whole pieces, e.g. ordered categoricals with differing categories
+    become objects.
+    """
+    if all(isinstance(a, pd.Categorical) for a in arrays):
+        try:
+            return pd.Series(union_categoricals(arrays))
+        except TypeError:
+            pass
+    return pd.concat([pd.Series(a) for a in arrays], ignore_index=True)
+
+
+def extend(vocabulary, df):
+    """Return vocabulary with new categories of df appended."""
+    vocabulary = dict(vocabulary)
+    for col in unordered(df):
+        known = pd.Index(vocabulary.get(col, []), dtype=object)
+        categories = df[col].cat.categories
+        categories = known.append(categories.difference(known, sort=False))
+        if len(categories) <= MAX_CATEGORIES:
+            vocabulary[col] = categories.tolist()
+        else:
+            vocabulary.pop(col, None)
+    return vocabulary
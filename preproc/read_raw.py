@@ -1,8 +1,19 @@
+import io
+
+import numpy as np
 import pandas as pd
 
 import aws
 
 
+# missing values in non-string columns, pandas' defaults (as of 1.5)
+NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan',
+    'null',
+]
+
+
 def read(path):
     dtypes = {
         'Transaction Reference': 'int32',
@@ -24,7 +35,6 @@ def read(path):
         'Credit Debit', 'User Precedence Tag Name', 'Manual Tag Name',
         'Auto Purpose Tag Name', 'Merchant Name', 'Merchant Business Line',
     ]
-    str_cleaner = dict.fromkeys(strings, lambda x: x.lower().strip())
 
     def col_selector(col_name):
         ignore = [
@@ -33,9 +43,33 @@ def read(path):
         ]
         return col_name not in ignore
 
-    return aws.s3read_csv(path, sep='|', parse_dates=dates,
-                       usecols=col_selector, dtype=dtypes,
-                       converters=str_cleaner)
+    with aws.s3open(path) as f, aws.compression(path, f, 'rb') as src:
+        # parse header once and read the data after it
+        header = pd.read_csv(io.BytesIO(src.readline()), sep='|',
+                             nrows=0).columns
+        # read strings verbatim (empty fields stay empty strings) and only
+        # parse missing values in other columns
+        nas = dict.fromkeys(header.difference(strings), NA_VALUES)
+        df = pd.read_csv(src, sep='|', header=None, names=header,
+                         parse_dates=dates, usecols=col_selector,
+                         dtype={**dtypes, **dict.fromkeys(strings, str)},
+                         keep_default_na=False, na_values=nas)
+    return normalise_strings(df, strings)
+
+
+def normalise_strings(df, columns):
+    """Lower-case and strip string columns.
+
+    Cleans the unique values of each column and maps them back to the rows,
+    which is much faster than calling a converter on every cell.
+    """
+    for col in columns:
+        codes, uniques = pd.factorize(df[col])
+        clean = pd.Series(uniques, dtype=object).str.lower().str.strip()
+        # missing values have code -1 and map to the appended NaN
+        clean = np.append(clean.to_numpy(), np.nan)
+        df[col] = clean.take(codes)
+    return df
 
 
 def clean_names(df):
@@ -0,0 +1,7 @@
+import os
+import sys
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..', 'preproc'))
+# synthetic raw extracts and compressed file writers
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
@@ -0,0 +1,59 @@
+import pandas as pd
+
+import aws
+
+
+def make_df(n=25):
+    return pd.DataFrame({'user_id': range(n), 'amount': [1.5] * n})
+
+
+def test_chunked_read_local(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    make_df().to_csv(path, index=False)
+    with aws.s3read_csv(path, chunksize=10) as reader:
+        chunks = list(reader)
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                  make_df())
+
+
+def test_chunked_read_memory():
+    path = 'memory://aws-test/data.csv'
+    aws.s3write_csv(make_df(), path)
+    reader = aws.s3read_csv(path, iterator=True)
+    assert len(reader.get_chunk(7)) == 7
+    assert len(reader.get_chunk(100)) == 18
+    reader.close()
+
+
+def test_info_of_growing_local_file(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text('user_id\n1\n')
+    assert aws.info(str(path))['size'] == 10
+    with open(path, 'a') as f:
+        f.write('2\n')
+    assert aws.info(str(path))['size'] == 12
+
+
+def test_batch_round_trip(tmp_path, capsys):
+    paths = [str(tmp_path / 'a.parquet'), 'memory://aws-test/b.parquet']
+    dfs = [make_df(10), make_df(20)]
+    assert aws.s3write_many(dfs, paths) == dfs
+    for df, got in zip(dfs, aws.s3read_many(paths)):
+        pd.testing.assert_frame_equal(got, df)
+    # one line per batch, with the sizes of the files written and read
+    size = sum(aws.filesystem(p).size(p) for p in paths)
+    mb = f'{size / 2**20:,.1f} MB'
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith(f'wrote 2 files of {mb}')
+    assert lines[1].startswith(f'read 2 files of {mb}')
+
+
+def test_batch_compressed_csv(tmp_path):
+    paths = [str(tmp_path / f'{i}.csv.gz') for i in range(3)]
+    dfs = [make_df(n) for n in [5, 1, 15]]
+    aws.s3write_many(dfs, paths, writer=pd.DataFrame.to_csv)
+    assert open(paths[0], 'rb').read(2) == b'\x1f\x8b'
+    for df, got in zip(dfs, aws.s3read_many(paths, reader=pd.read_csv)):
+        pd.testing.assert_frame_equal(got, df)
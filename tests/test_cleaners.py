@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# mlbt needs the project config
+cleaners = pytest.importorskip('mlbt.cleaners', exc_type=ImportError)
+
+from bench_pmt_pairs import (  # noqa: E402
+    make_txns, match_pairs_loop, tag_pmt_pairs_knn, transfers)
+
+
+@pytest.mark.parametrize('knn', [1, 2, 3])
+def test_pmt_pairs_sparse(knn, n_pairs=20_000, seed=0):
+    """Same transfers as knn loop if at most two txns per user and amount."""
+    rng = np.random.default_rng(seed)
+    first = make_txns(n_pairs, n_amounts=10**6, seed=seed)
+    second = first.copy()
+    second['transaction_date'] += pd.to_timedelta(
+        rng.integers(0, 8, n_pairs), unit='D')
+    second['credit_debit'] = rng.choice(['credit', 'debit'], n_pairs)
+    df = pd.concat([first, second], ignore_index=True)
+    keys = ['user_id', 'amount']
+    df = df[df.groupby(keys).amount.transform('size') == 2]
+    old = tag_pmt_pairs_knn(df.copy(), knn)
+    new = cleaners.tag_pmt_pairs(df.copy())
+    assert transfers(old) == transfers(new)
+
+
+def test_pmt_pairs_dense(n_rows=50_000):
+    """Only valid pairs, and at least as many as the knn loop finds."""
+    df = make_txns(n_rows, n_amounts=20)
+    old = tag_pmt_pairs_knn(df.copy())
+    new = cleaners.tag_pmt_pairs(df.copy())
+    pairs = new[new.tag.eq('transfers')]
+    counts = pairs.groupby(['user_id', 'amount', 'credit_debit']).size()
+    assert (counts.unstack(fill_value=0).diff(axis=1).iloc[:, -1] == 0).all()
+    assert len(transfers(new)) >= len(transfers(old))
+
+
+def test_match_pairs_maximal():
+    """Pairing each credit with the latest debit would leave d1 and c2
+    unpaired."""
+    group = np.zeros(4, dtype=int)
+    time = np.array([0, 3, 4, 7])
+    credit = np.array([False, False, True, True])
+    assert cleaners.match_pairs(group, time, credit, window=5).all()
+
+
+def test_match_pairs_loop(n_cases=2_000, seed=0):
+    """Same pairs as the greedy loop on small random groups."""
+    rng = np.random.default_rng(seed)
+    for _ in range(n_cases):
+        n = rng.integers(0, 60)
+        group = np.sort(rng.integers(0, rng.integers(1, 6), n))
+        secs = rng.integers(0, 40, n)
+        secs = secs[np.lexsort((secs, group))]
+        credit = rng.random(n) < rng.random()
+        window = rng.integers(1, 15)
+        assert (cleaners.match_pairs(group, secs, credit, window)
+                == match_pairs_loop(group, secs, credit, window)).all()
@@ -0,0 +1,59 @@
+import functools
+
+import pandas as pd
+import pytest
+
+# mlbt needs the project config
+make_data = pytest.importorskip('mlbt.make_data', exc_type=ImportError)
+# importing cleaners and selectors registers them
+pytest.importorskip('mlbt.cleaners', exc_type=ImportError)
+pytest.importorskip('mlbt.selectors', exc_type=ImportError)
+pytest.importorskip('zstandard')
+
+from bench_compressed import write_bgzf, write_seekable_zstd  # noqa: E402
+from bench_executors import available  # noqa: E402
+from bench_executors import ingest as ingest_on  # noqa: E402
+from synthetic import generate  # noqa: E402
+
+
+KEY = ['user_id', 'transaction_date', 'transaction_id']
+
+
+@pytest.fixture(scope='module')
+def raw_file(tmp_path_factory):
+    return generate(str(tmp_path_factory.mktemp('raw') / 'raw.csv'), 20_000)
+
+
+def ingest(path, **kwargs):
+    df, counts = make_data.ingest_data.__wrapped__(path, 4, 1, **kwargs)
+    return df.sort_values(KEY).reset_index(drop=True), counts
+
+
+def assert_same(result, expected):
+    (df, counts), (ref, ref_counts) = result, expected
+    assert len(df) == len(ref)
+    pd.testing.assert_frame_equal(df[ref.columns], ref,
+                                  check_categorical=False)
+    assert counts.keys() == ref_counts.keys()
+    assert all(abs(counts[k] - ref_counts[k]) < 1e-6 for k in counts)
+
+
+@pytest.mark.parametrize('write, suffix', [
+    (functools.partial(write_bgzf, block_size=2**14), '.gz'),
+    (functools.partial(write_seekable_zstd, frame_size=2**16), '.zst'),
+])
+def test_compressed_ingest(raw_file, tmp_path, write, suffix):
+    """Ranges of many blocks give the same data as the plain file."""
+    path = write(raw_file, str(tmp_path / f'raw.csv{suffix}'))
+    assert_same(ingest(path, backend='local'),
+                ingest(raw_file, backend='local'))
+
+
+@pytest.mark.parametrize('backend', ['process', 'dask', 'ray'])
+def test_backend_ingest(raw_file, tmp_path, backend):
+    """Workers of every backend give the same data as running in process."""
+    if not available(backend):
+        pytest.skip(f'{backend} not installed')
+    df, counts, _ = ingest_on(raw_file, backend, 2, 4, str(tmp_path))
+    assert_same((df.sort_values(KEY).reset_index(drop=True), counts),
+                ingest(raw_file, backend='local'))
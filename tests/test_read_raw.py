@@ -0,0 +1,35 @@
+import csv
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# mlbt needs the project config
+read_raw = pytest.importorskip('mlbt.read_raw', exc_type=ImportError)
+
+from synthetic import generate  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def raw_file(tmp_path_factory):
+    """Synthetic raw file with missing values spelled in several ways."""
+    path = generate(str(tmp_path_factory.mktemp('raw') / 'raw.csv'), 2_000)
+    df = pd.read_csv(path, sep='|', dtype=str, keep_default_na=False)
+    df.loc[:3, 'Latest Balance'] = ['#N/A', 'NULL', 'n/a', '']
+    df.loc[:3, 'Merchant Name'] = ['#N/A', 'NULL', 'n/a', '']
+    df.to_csv(path, sep='|', index=False, quoting=csv.QUOTE_ALL)
+    return path
+
+
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_missing_values(raw_file, engine):
+    """Missing in non-string columns, read verbatim in strings."""
+    df = read_raw.read_raw(raw_file, engine=engine)
+    assert np.isnan(df.latest_balance[:4]).all()
+    assert df.merchant_name[:4].tolist() == ['#n/a', 'null', 'n/a', '']
+
+
+def test_engines(raw_file):
+    pd.testing.assert_frame_equal(read_raw.read_raw(raw_file),
+                                  read_raw.read_raw(raw_file,
+                                                    engine='pyarrow'))